@@ -1,331 +1,77 @@
 import streamlit as st
 import pandas as pd
-import duckdb
-import re
 import numpy as np
 import io
 
 from config import *
-from utils import to_excel, highlight_values, get_criticidade
-from data_processing import (
-    read_excel_file,
-    read_excel_excess_file,
-    read_excel_weight_file,
-    read_excel_service_file
+from utils import classify_criticidade, criticidade_styles, CATEGORIA_NENHUMA, CATEGORIA_ESTILOS
+from database import read_loaded_versions, get_data_generation
+from core import (
+    open_database,
+    ingest_cotacoes,
+    ingest_ponderacoes,
+    ingest_excessoes,
+    load_app_data,
+    latest_status,
+    consolidated_table,
+    load_series,
+    series_key,
+    load_item_comparison,
+    load_top_changes,
+    load_quantile_stats,
+    national_coverage,
+    item_comparison_detail
 )
+from result_cache import cache_stats
+from exports import available_formats, export_file_name, export_mime, lazy_export, spec_key
+from connection import reader_connection
+from quantile_stats import JANELAS
 from visualizations import plot_time_series
-from data_update import atualizar_base_incremental
 
-def load_database(df: pd.DataFrame, table_name: str, con):
-    """Registra o DataFrame no DuckDB, criando (ou recriando) a tabela."""
-    con.register("df_excel", df)
-    con.execute(f"DROP TABLE IF EXISTS {table_name}")
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM df_excel")
+st.set_page_config(
+    page_title="Leitor de Controle de Cotações - IPC",
+    page_icon="../assets/logo_fgv.png"
+)
 
-def prepare_base_data(con, table_name, excess_table_name, weight_table_name, service_table_name):
-    """
-    Consulta as tabelas no banco de dados e prepara os DataFrames:
-      - df: Dados originais (incluindo agregação nacional - BR).
-      - df_melted: Dados no formato 'long' para análise de séries.
-      - df_excess: Itens de exceção.
-      - df_weight: Tabela de ponderações.
-      - colunas_datas: Colunas com datas.
-    """
-    query = f"SELECT * FROM {table_name}"
-    excess_query = f"SELECT * FROM {excess_table_name}"
-    weight_query = f"SELECT * FROM {weight_table_name}"
-    service_query = f"SELECT * FROM {service_table_name}"
-    
-    df = con.execute(query).fetchdf()
-    df_excess = con.execute(excess_query).fetchdf()
-    df_weight = con.execute(weight_query).fetchdf()
-    df_service = con.execute(service_query).fetchdf()
-    
-    colunas_datas = df.columns[3:]
-    df_br = df.groupby(["Código", "Descrição"], as_index=False)[colunas_datas].sum()
-    df_br["UF"] = "BR"
-    df_br = df_br[["UF", "Código", "Descrição"] + list(colunas_datas)]
-    df = pd.concat([df, df_br], ignore_index=True)
-    
-    df_melted = df.melt(
-        id_vars=["UF", "Código", "Descrição"],
-        value_vars=colunas_datas,
-        var_name="Data",
-        value_name="Valor"
-    )
-    df_melted["Valor"] = pd.to_numeric(df_melted["Valor"], errors="coerce")
-    df_melted["CodigoDescricao"] = (
-        df_melted["Código"].astype(str) + " - " + df_melted["Descrição"].astype(str)
-    )
-    
-    if not df_excess.empty:
-        excess_set = set(df_excess["DESCRIÇÃO"].dropna())
-        df_melted["Exceção"] = df_melted["CodigoDescricao"].apply(
-            lambda x: any(exc in x for exc in excess_set)
-        )
-    else:
-        df_melted["Exceção"] = False
-        
-    if not df_service.empty:
-        service_set = set(df_service["DESCRIÇÃO"].dropna())
-        df_melted["Serviço"] = df_melted["CodigoDescricao"].apply(
-            lambda x: any(serv in x for serv in service_set)
-        )
-    else:
-        df_melted["Serviço"] = False
+#st.logo("../assets/logo_ibre.png")
 
-    return df, df_melted, df_excess, df_weight, df_service,colunas_datas
+def style_quantidade(values):
+    """Retorna os estilos de criticidade para um valor, coluna ou matriz de quantidades."""
+    niveis, _ = classify_criticidade(values if np.ndim(values) else [values])
+    estilos = criticidade_styles(niveis)
+    return estilos if np.ndim(values) else estilos[0]
 
-def compute_comparative_data(df_melted):
+def consolidated_styles(df, categoria):
     """
-    Agrupa os dados (exceto os itens de exceção) para exibição na visão de status.
-    Calcula totais, SuperCrítico, Crítico, Aceitável, Suficiente e Exceção.
-    """
-    mask_status = (~df_melted["Exceção"]) & (~df_melted["Serviço"])
-    df_totais = df_melted.groupby(["UF", "Data"])["Valor"].count().rename("Total")
-    df_super_critico = df_melted[mask_status & (df_melted["Valor"] <= 25)] \
-                        .groupby(["UF", "Data"])["Valor"].count().rename("SuperCrítico")
-    df_critico = df_melted[mask_status & (df_melted["Valor"].between(26, 55))] \
-                   .groupby(["UF", "Data"])["Valor"].count().rename("Crítico")
-    df_aceitavel = df_melted[mask_status & (df_melted["Valor"].between(56, 100))] \
-                    .groupby(["UF", "Data"])["Valor"].count().rename("Aceitável")
-    df_suficiente = df_melted[mask_status & (df_melted["Valor"] > 100)] \
-                     .groupby(["UF", "Data"])["Valor"].count().rename("Suficiente")
-    df_excessao = df_melted[df_melted["Exceção"]] \
-                   .groupby(["UF", "Data"])["Valor"].count().rename("Exceção")
-    df_servico = df_melted[df_melted["Serviço"]] \
-               .groupby(["UF", "Data"])["Valor"].count().rename("Serviços")
-    
-    df_comparativo = pd.concat([df_totais, df_super_critico, df_critico,
-                                df_aceitavel, df_suficiente, df_excessao, df_servico], axis=1) \
-                      .fillna(0).reset_index()
-    
-    df_comparativo["Data_dt"] = pd.to_datetime(df_comparativo["Data"], format="%m/%Y", errors="coerce")
-    return df_comparativo
-
-def prepare_quantity_table(df, df_excess, df_service):
+    Matriz de estilos da tabela consolidada, calculada por coluna de uma vez: nas colunas
+    '_qtd', a cor da categoria do item (especial, serviço, exceção) ou, sem categoria,
+    a cor de criticidade da quantidade. Usada com Styler.apply(axis=None).
     """
-    Prepara o DataFrame que será usado na aba "Controle de Cotações".
-    Cria as colunas: CodigoDescricao, UF (normalizada), Grupo e Exceção.
-    """
-    df_tab = df.copy()
-    df_tab["CodigoDescricao"] = df_tab["Código"].astype(str) + " - " + df_tab["Descrição"].astype(str)
-    df_tab["UF"] = df_tab["UF"].str.strip().str.upper()
-    df_tab["Grupo"] = df_tab["Código"].astype(str).str[:4]
-
-    if not df_excess.empty:
-        excess_set = set(df_excess["DESCRIÇÃO"].dropna())
-        df_tab["Exceção"] = df_tab["CodigoDescricao"].apply(lambda x: any(exc in x for exc in excess_set))
-    else:
-        df_tab["Exceção"] = False
-        
-    if not df_service.empty:
-        service_set = set(df_service["DESCRIÇÃO"].dropna())
-        df_tab["Serviço"] = df_tab["CodigoDescricao"].apply(lambda x: any(serv in x for serv in service_set))
-    else:
-        df_tab["Serviço"] = False
-
-    return df_tab
-
-def style_quantidade(val):
-    if pd.isna(val):
-        return ""
-    critic = get_criticidade(val)
-    style_map = {
-        "SuperCrítico": "background-color: #ff4d4d; color: black;",
-        "Crítico": "background-color: #ffa500; color: black;",
-        "Aceitável": "background-color: #FCDA51; color: black;",
-        "Suficiente": "background-color: #66cc66; color: black;",
-        "Exceção": "background-color: gray; color: black;"
-    }
-    return style_map.get(critic, "")
-
-def style_locked_quantidade(val):
-    try:
-        numeric_val = float(val)
-        return style_quantidade(numeric_val)
-    except Exception:
-        return ""
-    
-            
-def compute_statistics_from_pivot(pivot_df):
-                """
-                Recebe um pivot table (com índices = CodigoDescricao e colunas = UFs) contendo valores numéricos.
-                Converte para formato longo, filtra os valores cujas classificações, segundo get_criticidade, 
-                sejam diferentes de "Exceção" e "Suficiente" e retorna os valores do primeiro quartil, 
-                mediana e terceiro quartil agrupados por UF.
-                """
-                id_col = pivot_df.index.name if pivot_df.index.name is not None else "index"
-                df_long = pivot_df.reset_index().melt(id_vars=id_col, var_name="UF", value_name="Valor")
-
-                df_long = df_long[df_long["Valor"] != '-']
-                
-                df_long["Valor"] = pd.to_numeric(df_long["Valor"], errors="coerce")
-                
-                df_long["Criticidade"] = df_long["Valor"].apply(get_criticidade)
-                df_long = df_long.dropna(subset=["Valor"])
-                
-                df_valid = df_long[~df_long["Criticidade"].isin(["Exceção", "Suficiente"])]
-                
-                stats = df_valid.groupby("UF")["Valor"].agg(
-                    Q1=lambda x: x.quantile(0.25),
-                    Median="median",
-                    Mean = "mean",
-                    Q3=lambda x: x.quantile(0.75)
-                )
-                return stats
-
-
-def filter_quantity_data(df_tab ,input_capital, selected_item, selected_group, selected_criticidade,date_cols):
-    df_filtered = df_tab.copy()
-    
-    if input_capital:
-        df_filtered = df_filtered[df_filtered["UF"].isin(input_capital)]
-    if selected_item:
-        df_filtered = df_filtered[df_filtered["CodigoDescricao"].isin(selected_item)]
-    if selected_group:
-        df_filtered = df_filtered[df_filtered["Grupo"].isin(selected_group)]
-    
-    if selected_criticidade:
-        cols_to_check = [date_cols] if isinstance(date_cols, str) else date_cols
-        def row_matches(row):
-            if row["Exceção"] and "Exceção" in selected_criticidade:
-                return True
-            if row.get("Serviço", False) and "Serviços" in selected_criticidade:
-                return True
-            if not row["Exceção"] and not row.get("Serviço", False):
-                for col in cols_to_check:
-                    val = row.get(col)
-                    if pd.notnull(val):
-                        if get_criticidade(val) in selected_criticidade:
-                            return True
-            return False
-
-        df_filtered = df_filtered[df_filtered.apply(row_matches, axis=1)]
-    
-    return df_filtered
-
-def filter_weight_data(df_tab ,input_capital, selected_item, selected_group):
-    df_filtered = df_tab.copy()
-    
-    if input_capital:
-        df_filtered = df_filtered[df_filtered["UF"].isin(input_capital)]
-    if selected_item:
-        df_filtered = df_filtered[df_filtered["CodigoDescricao"].isin(selected_item)]
-    if selected_group:
-        df_filtered = df_filtered[df_filtered["Grupo"].isin(selected_group)]
-
-    
-    return df_filtered
+    categoria = np.asarray(categoria)
+    estilos = np.full(df.shape, "", dtype=object)
+    for j, col in enumerate(df.columns):
+        if col.endswith("_qtd"):
+            estilos[:, j] = np.where(
+                categoria != CATEGORIA_NENHUMA, CATEGORIA_ESTILOS[categoria], style_quantidade(df[col])
+            )
+    return pd.DataFrame(estilos, index=df.index, columns=df.columns)
 
 def build_index_pivot_table(df, locked_date, df_base):
     """
-    Constrói uma tabela pivot de índices a partir da base consolidada (df) e
-    utiliza o mapeamento definido abaixo. Usa a tabela df_base (geralmente o df_tab)
+    Constrói a matriz de índices de criticidade (CodigoDescricao x UF) a partir da base
+    consolidada (df), em int8: 0 = Exceção, 1 = Suficiente, 2 = Aceitável, 3 = Crítico,
+    4 = SuperCrítico e -1 = sem valor. Usa a tabela df_base (geralmente o df_tab)
     para recuperar o flag 'Exceção' de cada CodigoDescricao.
     """
-    df_locked = df[["UF", "CodigoDescricao", locked_date, "Exceção"]].copy()
-    df_locked.rename(columns={locked_date: "Valor"}, inplace=True)
-    df_pivot = df_locked.pivot(index="CodigoDescricao", columns="UF", values="Valor")
-    df_pivot = df_pivot.fillna('-')
-    if "BR" in df_pivot.columns:
-        df_pivot = df_pivot.drop("BR", axis=1)
-    
-    exception_mapping = df_base.drop_duplicates("CodigoDescricao").set_index("CodigoDescricao")["Exceção"]
-    
-    criticidade_mapping = {
-        "Suficiente": 1,
-        "Aceitável": 2,
-        "Crítico": 3,
-        "SuperCrítico": 4,
-    }
-    
-    def cell_to_index(val, codigo):
-        if exception_mapping.get(codigo, False):
-            return 0  
-        if isinstance(val, (int, float)):
-            crit = get_criticidade(val)
-            return criticidade_mapping.get(crit, np.nan)
-        return np.nan
-
-    df_index = df_pivot.copy()
-    for codigo in df_index.index:
-        for col in df_index.columns:
-            df_index.loc[codigo, col] = cell_to_index(df_index.loc[codigo, col], codigo)
-    return df_index
-
-    
-
-def build_pivot_table(df, locked_date):
-    df_locked = df[["UF", "CodigoDescricao", locked_date, "Exceção"]].copy()
-    df_locked.rename(columns={locked_date: "Valor"}, inplace=True)
-    df_pivot = df_locked.pivot(index="CodigoDescricao", columns="UF", values="Valor")
-    df_pivot = df_pivot.fillna('-')
-    df_pivot = df_pivot.map(lambda x: int(x) if isinstance(x, float) and x.is_integer() else x)
-    if "BR" in df_pivot.columns:
-        df_pivot = df_pivot.drop("BR", axis=1)
-    df_pivot.index.name = "CodigoDescricao"
-    return df_pivot
-
-def build_weight_pivot_table(df, locked_date):
-    df_locked = df[["UF", "CodigoDescricao", locked_date]].copy()
-    df_locked.rename(columns={locked_date: "Valor"}, inplace=True)
-    df_pivot = df_locked.pivot(index="CodigoDescricao", columns="UF", values="Valor")
-    df_pivot = df_pivot.fillna('-')
-    df_pivot = df_pivot.map(lambda x: int(x) if isinstance(x, float) and x.is_integer() else x)
-    if "BR" in df_pivot.columns:
-        df_pivot = df_pivot.drop("BR", axis=1)
-    df_pivot.index.name = "CodigoDescricao"
-    
-    return df_pivot
-
-
-
-def process_weight_data(df_weight: pd.DataFrame):
-    """
-    Processa a base de ponderações:
-      - Filtra os itens com Cód.Estrutura com tamanho >= 6.
-      - Formata as colunas numéricas e cria a coluna 'CodigoDescricao' e 'Grupo'.
-      - Retorna o DataFrame filtrado, a lista de colunas de data e o dicionário com os limites para formatação.
-    """
+    df_pivot = df.pivot(index="CodigoDescricao", columns="UF", values=locked_date)
+    df_pivot = df_pivot.drop(columns="BR", errors="ignore")
 
-    df_weight_filtrado = df_weight[df_weight["Cód.Estrutura"].str.len() >= 6].copy()
-
-    df_weight_filtrado["CodigoDescricao"] = (
-        df_weight_filtrado["Cód.Estrutura"].astype(str) + " - " + df_weight_filtrado["Descrição"].astype(str)
-    ).str.strip()
-    
-    colunas = df_weight_filtrado.columns.tolist()
-    colunas.remove("CodigoDescricao")
-    idx_uf = colunas.index("UF")
-    colunas.insert(idx_uf, "CodigoDescricao")
-    df_weight_filtrado = df_weight_filtrado[colunas]
-    
-    df_weight_filtrado['Cód_Estrutura_4'] = df_weight_filtrado['Cód.Estrutura'].str[:4]
-    df_weight_filtrado["Grupo"] = df_weight_filtrado["CodigoDescricao"].str.split(" - ").str[0].str[:4]
-    
-    date_cols_weight = [col for col in df_weight_filtrado.columns if re.match(r'\d{2}/\d{4}', col)]
-    for col in date_cols_weight:
-        df_weight_filtrado[col] = (
-            df_weight_filtrado[col]
-            .str.replace('.', '', regex=False)
-            .str.replace(',', '.', regex=False)
-        )
-        df_weight_filtrado[col] = pd.to_numeric(df_weight_filtrado[col], errors='coerce')
-
-    capital_to_uf = {
-            "Belo Horizonte": "MG",
-            "Brasília": "DF",
-            "Porto Alegre": "RS",
-            "Recife": "PE",
-            "Rio de Janeiro": "RJ",
-            "Salvador": "BA",
-            "São Paulo": "SP",
-            "BR": "BR"
-        }
-    df_weight_filtrado["UF"] = df_weight_filtrado["UF"].map(capital_to_uf).fillna(df_weight_filtrado["UF"])
-    return df_weight_filtrado
+    exception_mapping = df_base.drop_duplicates("CodigoDescricao").set_index("CodigoDescricao")["Exceção"]
+    excecao = exception_mapping.reindex(df_pivot.index, fill_value=False).to_numpy(dtype=bool)
 
+    niveis, _ = classify_criticidade(df_pivot)
+    niveis[excecao, :] = 0
+    return pd.DataFrame(niveis, index=df_pivot.index, columns=df_pivot.columns)
 
 def create_legend():
     """Cria a legenda exibida na sidebar da aplicação."""
@@ -420,7 +166,8 @@ def create_legend():
     """
     st.sidebar.markdown(legend_markdown, unsafe_allow_html=True)
 
-def display_visao_geral(tab, df_comparativo, target_date, df_tab, df_weight, colunas_datas):
+def display_visao_geral(tab, df_comparativo, target_date, df_tab, df_cobertura, colunas_datas, db_path, geracao,
+                        formato):
     with tab:
         sub_tab_status, sub_tab_controle = st.tabs([
              "Visão de Status por Quantidade",
@@ -429,11 +176,7 @@ def display_visao_geral(tab, df_comparativo, target_date, df_tab, df_weight, col
         
         with sub_tab_status:
             st.write(f"### Visão de Status por Quantidade - {target_date}")
-            df_recent = df_comparativo[ df_comparativo["Data_dt"] == df_comparativo["Data_dt"].max() ]
-            st.dataframe(
-                df_recent[["UF", "Data", "Total", "SuperCrítico", "Crítico",
-                           "Aceitável", "Suficiente", "Exceção", "Serviços"]]
-            )
+            st.dataframe(latest_status(df_comparativo))
         
         with sub_tab_controle:
             st.write("### Controle de Cotações")
@@ -445,7 +188,6 @@ def display_visao_geral(tab, df_comparativo, target_date, df_tab, df_weight, col
                 index=0,
                 key="quant_capital"
             )
-            input_capital = [selected_capital] if selected_capital else []
             selected_item = col2.multiselect(
                 "Selecione os itens:",
                 df_tab["CodigoDescricao"].unique(),
@@ -478,215 +220,103 @@ def display_visao_geral(tab, df_comparativo, target_date, df_tab, df_weight, col
             )
 
             st.write("### Tabela Consolidada")
-            df_filtrado = filter_quantity_data(
-                df_tab,
-                input_capital,
-                selected_item,
-                selected_group,
-                selected_criticidade,
-                selected_date or all_dates
-            )
-            locked_date = default_date  
-            
-            df_pivot = build_pivot_table(df_filtrado, locked_date)
-            exception_map = df_tab.set_index("CodigoDescricao")["Exceção"].to_dict()
-            service_map = df_tab.set_index("CodigoDescricao")["Serviço"].to_dict()
-            
-            df_weight_base = process_weight_data(df_weight)
-            df_weight_filtrado = filter_weight_data(df_weight_base, input_capital, selected_item, selected_group)
-            df_weight_pivot = build_weight_pivot_table(df_weight_filtrado, locked_date)
-            
-            
-            df_q = df_pivot.reset_index()
-            df_q["Código"] = df_q["CodigoDescricao"].str.split(" - ").str[0]
-            df_w = df_weight_pivot.reset_index()
-            
-            df_w["Código"] = df_w["CodigoDescricao"].str.split(" - ").str[0]
-            merge = pd.merge(df_q, df_w, on="Código", how="inner")
-            
-            cols_x = [c for c in merge.columns if c.endswith('_x') and c != 'CodigoDescricao_x']
-            cols_y = [c for c in merge.columns if c.endswith('_y') and c != 'CodigoDescricao_y']
-
-            df_sel = merge[['CodigoDescricao_x'] + cols_x + cols_y].copy()
-
-            rename_map = {'CodigoDescricao_x': 'CodigoDescricao'}
-
-            for c in cols_x:
-                uf = c[:-2] 
-                rename_map[c] = f'{uf}_qtd'
-
-            for c in cols_y:
-                uf = c[:-2] 
-                rename_map[c] = f'{uf}_pond'
-            
-            df_sel.rename(columns=rename_map, inplace=True)
+            # Quantidade x ponderação já vem juntada, classificada e priorizada para todas as UFs
+            # (ver database.query_coverage); aqui só se filtra e ordena (ver core.consolidated_table).
+            filtros = {
+                "CodigoDescricao": selected_item,
+                "Grupo": selected_group,
+                "Prioridade": selected_prioridade,
+            }
+            df_display, categoria = consolidated_table(df_cobertura, selected_capital, filtros, selected_criticidade)
+            qtd_col = f"{selected_capital}_qtd"
+            styled = df_display.style.apply(consolidated_styles, axis=None, categoria=categoria)
+
+            st.dataframe(styled)
             
-            qtd_cols = [c for c in df_sel.columns if c.endswith("_qtd")]
-            pond_cols = [c for c in df_sel.columns if c.endswith("_pond")]
-            
-            if len(qtd_cols) != 1:
-                st.error(
-                    "Erro: esperava exatamente 1 coluna de quantidade, mas encontrou: "
-                    + str(qtd_cols)
-                )
-            else:
-                qtd_col = qtd_cols[0]
-                pond_col = pond_cols[0]
-                df_sel["Criticidade"] = df_sel.apply(
-                    lambda row: "Exceção" 
-                                if exception_map.get(row["CodigoDescricao"], False) 
-                                else get_criticidade(row[qtd_col]),
-                    axis=1
-                )
-                df_sel["Prioridade"] = df_sel[pond_col].apply(
-                    lambda x: "Prioridade 1" if x > 1
-                            else ("Prioridade 2" if x > 0.4 else "Prioridade 3")
-                )
+            # Os arquivos só são gerados no clique e ficam em cache por geração dos dados e filtros
+            st.download_button(
+                label="📥 Baixar Tabela Consolidada",
+                data=lazy_export(
+                    db_path, geracao,
+                    ("tabela_consolidada", spec_key(filtros), tuple(selected_criticidade or ()), qtd_col),
+                    lambda: df_display.assign(Categoria=categoria),
+                    formato, "Tabela_Consolidada", [qtd_col], "Categoria"
+                ),
+                file_name=export_file_name("tabela_consolidada", formato),
+                mime=export_mime(formato)
+            )
 
-                severity_map = {
-                    "SuperCrítico": 4,
-                    "Crítico":      3,
-                    "Aceitável":    2,
-                    "Suficiente":   1,
-                    "Exceção":      0, 
-                }
-                df_sel["CriticidadeNivel"] = df_sel["Criticidade"].map(severity_map)
-                
-                if selected_prioridade:
-                    df_sel = df_sel[df_sel["Prioridade"].isin(selected_prioridade)]
-
-                df_sorted = df_sel.sort_values(
-                    by=["CriticidadeNivel", pond_col],
-                    ascending=[False, False]
-                ).reset_index(drop=True)
-                
-
-                df_sorted["Falta p/ Cobertura Mínima"] = df_sorted[qtd_col].apply(lambda x: max(0, 100 - x))
-                
-                #df_sorted["Qtd - BP"] = None
-                cols_display = [
-                    c for c in df_sorted.columns
-                    if c not in ("Criticidade", "CriticidadeNivel")
-                    and not c.endswith("_pond")
-                ]
-                ordered = ["CodigoDescricao"] + [
-                    c for c in cols_display if c != "CodigoDescricao"
-                ]
-                df_display = df_sorted[ordered]
-
-                SPECIAL_PREFIXES = [
-                    "280107", "280501",
-                    "350101",
-                    "410301", "410305", "410307", "410319"
-                ]
-                def style_full_row(row):
-                    styles = []
-                    for col in df_display.columns:
-                        if col.endswith("_qtd"):
-                            if any(row["CodigoDescricao"].startswith(pref) for pref in SPECIAL_PREFIXES):
-                                styles.append("background-color: #B845F5; color: white")
-                            elif service_map.get(row["CodigoDescricao"], False):
-                                styles.append("background-color: #3C5096; color: white;")
-                            else:
-                                if exception_map.get(row["CodigoDescricao"], False):
-                                    styles.append("background-color: gray; color: black;")
-                                else:
-                                    styles.append(style_quantidade(row[col]))
-                        else:
-                            styles.append("")
-                    return styles
-
-                styled = df_display.style.apply(style_full_row, axis=1)
-                
-
-                st.dataframe(styled)
-                
-                st.download_button(
-                    label="📥 Baixar Tabela Consolidada",
-                    data=to_excel(styled, "Tabela_Consolidada"),
-                    file_name="tabela_consolidada.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-        
-def display_series_historica(tab, df, colunas_datas):
+            st.download_button(
+                label="📥 Baixar Cobertura de Todas as UFs",
+                data=lazy_export(
+                    db_path, geracao, ("cobertura_ufs",), lambda: national_coverage(df_cobertura),
+                    formato, "Cobertura_UFs", ["Quantidade"], "Categoria"
+                ),
+                file_name=export_file_name("cobertura_todas_ufs", formato),
+                mime=export_mime(formato)
+            )
+    
+def display_series_historica(tab, serie, db_path, geracao):
+    """
+    Aba: Série Histórica. As opções vêm das dimensões de UFs e itens (ver
+    core.prepare_base_data); a série é consultada no banco só para a seleção (core.load_series).
+    """
     with tab:
-        df_series = df.melt(id_vars=["UF", "Código", "Descrição"], value_vars=colunas_datas,
-                            var_name="Data", value_name="Valor")
-        df_series["Valor"] = pd.to_numeric(df_series["Valor"], errors="coerce")
-        df_series["Data_clean"] = pd.to_datetime(
-            df_series["Data"].str.extract(r'(\d{2}/\d{4})')[0], format="%m/%Y")
-        df_series["CodigoDescricao"] = df_series["Código"].astype(str) + " - " + df_series["Descrição"].astype(str)
-        df_series["Grupo"] = df_series["Código"].astype(str).str[:4]
+        itens = serie["itens"]
         
-        capitais_series = sorted(df["UF"].unique())
+        capitais_series = sorted(serie["ufs"])
         col1, col2, col3 = st.columns(3)
         selected_capitais = col1.multiselect("Selecione a UF/BR:", capitais_series, key="series_uf")
-        group_options = sorted(df_series["Grupo"].unique())
+        group_options = sorted(itens["Grupo"].unique())
         selected_group = col2.multiselect("Selecione o grupo:", group_options, key="series_group")
 
         if selected_group:
-            unique_items = sorted(df_series[df_series["Grupo"].isin(selected_group)]["CodigoDescricao"].unique())
+            unique_items = sorted(itens.loc[itens["Grupo"].isin(selected_group), "CodigoDescricao"].unique())
         else:
-            unique_items = sorted(df_series["CodigoDescricao"].unique())
+            unique_items = sorted(itens["CodigoDescricao"].unique())
         selected_items = col3.multiselect("Selecione o item:", unique_items, key="series_item")
         
         if not selected_capitais or (not selected_items and not selected_group):
             st.error("Por favor, selecione ao menos uma região e um item ou grupo para visualizar a série histórica.")
         else:
-            df_series_filtered = df_series[df_series["UF"].isin(selected_capitais)]
-            if selected_group:
-                df_series_filtered = df_series_filtered[df_series_filtered["Grupo"].isin(selected_group)]
-            if selected_items:
-                df_series_filtered = df_series_filtered[df_series_filtered["CodigoDescricao"].isin(selected_items)]
-            if not df_series_filtered.empty:
-                df_pivot = df_series_filtered.pivot_table(index="Data_clean",
-                                                          columns=["UF", "CodigoDescricao"],
-                                                          values="Valor", aggfunc="mean")
-                plot_time_series(df_pivot)
+            with reader_connection(db_path) as con:
+                df_pivot = load_series(con, db_path, selected_capitais, selected_group, selected_items)
+            if not df_pivot.empty:
+                plot_time_series(
+                    df_pivot, db_path, geracao, series_key(selected_capitais, selected_group, selected_items)
+                )
             else:
                 st.warning("Selecione pelo menos uma região e/ou item para visualizar a série histórica.")
     
 def display_comparativo_mes(
     tab,
-    df: pd.DataFrame,
-    df_excess: pd.DataFrame,
-    df_service: pd.DataFrame,
-    colunas_datas
+    df_totais: pd.DataFrame,
+    df_insumos: pd.DataFrame,
+    colunas_datas,
+    ufs,
+    db_path: str,
+    geracao: int,
+    formato: str
 ):
     """
     Aba: Comparativo Mensal
-      - Sub-aba 1: Atual vs Anterior (totais + diferença)
-      - Sub-aba 2: Gráfico mês a mês (agregado total do mês)
+      - Sub-aba 1: Atual vs Anterior (totais + diferença) para qualquer par de meses e UF,
+        e as maiores quedas contra o mês anterior ou o mesmo mês do ano anterior
+      - Sub-aba 2: Gráfico mês a mês (agregado total do mês) e a evolução dos quantis por UF
+        (quantile_stats.resumo_quantis, mensais ou em janela móvel)
+    df_totais e df_insumos (BR, últimos dois meses) vêm dos resumos materializados (ver
+    database.read_monthly_totals e database.read_item_comparison); outros pares e as
+    maiores quedas são lidos das variações materializadas (database.resumo_variacoes).
     """
     with tab:
         st.write("### Comparativo Mensal")
 
-        if df is None or df.empty or colunas_datas is None or len(colunas_datas) < 2:
+        if df_insumos is None or df_insumos.empty or colunas_datas is None or len(colunas_datas) < 2:
             st.warning("Base insuficiente para comparar (precisa de pelo menos 2 meses de colunas).")
             return
 
         # garante lista simples
         date_cols = list(colunas_datas)
-        locked_date_atual = date_cols[-1]
-        locked_date_anterior = date_cols[-2]
-
-        # Remove BR para não duplicar (df já contém BR agregado no prepare_base_data)
-        df_base = df[df["UF"].astype(str).str.upper().str.strip() != "BR"].copy()
-
-        df_base["CodigoDescricao"] = df_base["Código"].astype(str) + " - " + df_base["Descrição"].astype(str)
-
-        # Flags (mantém consistência com o resto do app; não filtra por padrão)
-        if df_excess is not None and (not df_excess.empty) and "DESCRIÇÃO" in df_excess.columns:
-            excess_set = set(df_excess["DESCRIÇÃO"].dropna())
-            df_base["Exceção"] = df_base["CodigoDescricao"].apply(lambda x: any(exc in x for exc in excess_set))
-        else:
-            df_base["Exceção"] = False
-
-        if df_service is not None and (not df_service.empty) and "DESCRIÇÃO" in df_service.columns:
-            service_set = set(df_service["DESCRIÇÃO"].dropna())
-            df_base["Serviço"] = df_base["CodigoDescricao"].apply(lambda x: any(serv in x for serv in service_set))
-        else:
-            df_base["Serviço"] = False
 
         sub1, sub2 = st.tabs([
             "Atual vs Anterior",
@@ -697,14 +327,26 @@ def display_comparativo_mes(
         # Sub-aba 1: Resumo + (opcional) detalhe por insumo
         # =========================
         with sub1:
-            st.caption(f"Comparando **{locked_date_atual}** (Atual) vs **{locked_date_anterior}** (Anterior).")
+            c_atual, c_anterior, c_uf = st.columns(3)
+            locked_date_atual = c_atual.selectbox(
+                "Mês atual:", date_cols, index=len(date_cols) - 1, key="comp_atual"
+            )
+            locked_date_anterior = c_anterior.selectbox(
+                "Comparar com:", date_cols, index=len(date_cols) - 2, key="comp_anterior"
+            )
+            uf_comp = c_uf.selectbox(
+                "UF:", ["BR"] + sorted(uf for uf in ufs if uf != "BR"), key="comp_uf"
+            )
+
+            padrao = (locked_date_atual, locked_date_anterior, uf_comp) == (date_cols[-1], date_cols[-2], "BR")
+            if not padrao:
+                with reader_connection(db_path) as con:
+                    df_insumos = load_item_comparison(con, db_path, locked_date_atual, locked_date_anterior, uf_comp)
 
-            df_f = df_base.copy()
-            for c in [locked_date_atual, locked_date_anterior]:
-                df_f[c] = pd.to_numeric(df_f[c], errors="coerce")
+            st.caption(f"Comparando **{locked_date_atual}** (Atual) vs **{locked_date_anterior}** (Anterior).")
 
-            total_atual = float(df_f[locked_date_atual].sum(skipna=True))
-            total_anterior = float(df_f[locked_date_anterior].sum(skipna=True))
+            total_atual = float(df_insumos["Qtd_Atual"].sum(skipna=True))
+            total_anterior = float(df_insumos["Qtd_Anterior"].sum(skipna=True))
             diff = total_atual - total_anterior
             pct = (diff / total_anterior * 100) if total_anterior not in (0, np.nan) and total_anterior != 0 else np.nan
 
@@ -717,67 +359,93 @@ def display_comparativo_mes(
                 c3.metric("Diferença", f"{diff:,.0f}".replace(",", "."), delta=f"{pct:.2f}%")
 
             st.divider()
-            st.write("#### Detalhe por insumo (BR agregado por soma das UFs)")
-            agg = (
-                df_f.groupby("CodigoDescricao", as_index=False)[[locked_date_atual, locked_date_anterior]]
-                    .sum(min_count=1)
-            )
-            agg.rename(columns={
-                locked_date_atual: "Qtd_Atual",
-                locked_date_anterior: "Qtd_Anterior",
-            }, inplace=True)
-
-            agg["Diferença"] = agg["Qtd_Atual"] - agg["Qtd_Anterior"]
-            den = agg["Qtd_Anterior"].replace({0: np.nan})
-            agg["Diferença (%)"] = (agg["Diferença"] / den) * 100
-
+            if uf_comp == "BR":
+                st.write("#### Detalhe por insumo (BR agregado por soma das UFs)")
+            else:
+                st.write(f"#### Detalhe por insumo ({uf_comp})")
             # pior queda primeiro
-            agg = agg.sort_values(by=["Diferença", "Qtd_Atual"], ascending=[True, True]).reset_index(drop=True)
+            agg = item_comparison_detail(df_insumos)
 
             st.dataframe(agg)
 
             st.download_button(
-                label="📥 Baixar Detalhe (Excel)",
-                data=to_excel(agg, "Comparativo_Insumo_BR"),
-                file_name="comparativo_atual_vs_anterior_detalhe_por_insumo.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                label=f"📥 Baixar Detalhe ({formato})",
+                data=lazy_export(
+                    db_path, geracao, ("comparativo_insumo", locked_date_atual, locked_date_anterior, uf_comp),
+                    lambda: agg, formato, "Comparativo_Insumo_BR"
+                ),
+                file_name=export_file_name("comparativo_atual_vs_anterior_detalhe_por_insumo", formato),
+                mime=export_mime(formato)
             )
 
+            st.divider()
+            st.write(f"#### Maiores quedas em {locked_date_atual} ({uf_comp})")
+            base_quedas = st.radio(
+                "Comparar com:",
+                options=["mes", "ano"],
+                format_func={"mes": "Mês anterior", "ano": "Mesmo mês do ano anterior"}.get,
+                horizontal=True,
+                key="quedas_base"
+            )
+            with reader_connection(db_path) as con:
+                df_quedas = load_top_changes(con, db_path, locked_date_atual, base_quedas, uf_comp)
+            if df_quedas.empty:
+                st.info("Sem base de comparação para esse mês.")
+            else:
+                st.dataframe(df_quedas, hide_index=True)
+
         # =========================
         # Sub-aba 2: Série mensal agregada (gráfico)
         # =========================
         with sub2:
             st.caption("Gráfico mês a mês considerando o **total agregado do mês**.")
 
-            df_series = df_base.copy()
-
-            # Converte todas as colunas de data para numérico
-            for c in date_cols:
-                df_series[c] = pd.to_numeric(df_series[c], errors="coerce")
-
-            totais_por_mes = df_series[date_cols].sum(axis=0, skipna=True)
-
-            # Parse robusto de rótulos tipo "mm/YYYY"
-            def _parse_mes_label(label: str):
-                m = re.search(r"(\d{2}/\d{4})", str(label))
-                return pd.to_datetime(m.group(1), format="%m/%Y", errors="coerce") if m else pd.NaT
-
-            df_totais = pd.DataFrame({
-                "Data": date_cols,
-                "Data_dt": [ _parse_mes_label(c) for c in date_cols ],
-                "Total": totais_por_mes.values
-            }).dropna(subset=["Data_dt"]).sort_values("Data_dt")
-
             st.line_chart(df_totais.set_index("Data_dt")["Total"])
 
             with st.expander("Ver tabela do agregado mensal"):
                 st.dataframe(df_totais[["Data", "Total"]])
 
             st.download_button(
-                label="📥 Baixar Agregado Mensal (Excel)",
-                data=to_excel(df_totais[["Data", "Total"]], "Agregado_Mensal"),
-                file_name="agregado_total_mes_a_mes.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                label=f"📥 Baixar Agregado Mensal ({formato})",
+                data=lazy_export(
+                    db_path, geracao, ("agregado_mensal",),
+                    lambda: df_totais[["Data", "Total"]], formato, "Agregado_Mensal"
+                ),
+                file_name=export_file_name("agregado_total_mes_a_mes", formato),
+                mime=export_mime(formato)
+            )
+
+            st.divider()
+            st.write("#### Quantis das quantidades por UF")
+            st.caption(
+                "Consideram apenas quantidades não suficientes (até 100 cotações)."
+            )
+            c_estat, c_janela = st.columns(2)
+            estatistica = c_estat.selectbox(
+                "Estatística:", ["Median", "Q1", "Q3", "Mean"],
+                format_func={"Median": "Mediana", "Q1": "1º quartil", "Q3": "3º quartil", "Mean": "Média"}.get,
+                key="quantis_estatistica"
+            )
+            janela = c_janela.radio(
+                "Janela:", options=list(JANELAS),
+                format_func=lambda j: "Mês" if j == 1 else f"{j} meses (móvel)",
+                horizontal=True, key="quantis_janela"
+            )
+            with reader_connection(db_path) as con:
+                df_quantis = load_quantile_stats(con, db_path, janela)
+            st.line_chart(df_quantis.pivot(index="Data_dt", columns="UF", values=estatistica))
+
+            with st.expander("Ver tabela dos quantis"):
+                st.dataframe(df_quantis.drop(columns="Data_dt"), hide_index=True)
+
+            st.download_button(
+                label=f"📥 Baixar Quantis ({formato})",
+                data=lazy_export(
+                    db_path, geracao, ("quantis", janela),
+                    lambda: df_quantis.drop(columns="Data_dt"), formato, "Quantis_UF"
+                ),
+                file_name=export_file_name(f"quantis_por_uf_janela_{janela}", formato),
+                mime=export_mime(formato)
             )
 
 
@@ -851,58 +519,59 @@ def main():
    
     create_legend()
     
-    db_path = "ipc.db"
-    excess_table_name = "excessoes"
-    service_table_name = "servicos"
-    weight_table_name = "ponderacoes"
-    table_name = "controle_cotacoes"
-    con = duckdb.connect(db_path)
+    db_path = DB_PATH
+    open_database(db_path)
+
+    # Arquivos já carregados (mesmo SHA-256 da última carga da base) não são relidos nem regravados.
+    # As cargas usam a conexão de escrita (uma por vez); as telas leem de cursores com snapshot.
     if uploaded_file is not None:
-        df_novo = read_excel_file(uploaded_file)
-        load_database(df_novo, table_name, con)
+        contagem = ingest_cotacoes(db_path, uploaded_file)
+        if contagem is not None:
+            st.sidebar.success(
+                f"Base de cotações atualizada: {contagem['inseridas']} inseridas, "
+                f"{contagem['atualizadas']} atualizadas, {contagem['inalteradas']} inalteradas, "
+                f"{contagem['removidas']} removidas."
+            )
     
     if uploaded_file_weight is not None:
-        df_weight_novo = read_excel_weight_file(uploaded_file_weight)
+        ingest_ponderacoes(db_path, uploaded_file_weight)
 
-        load_database(df_weight_novo, weight_table_name, con)
-
-    
     if uploaded_excess_file is not None:
-        df_excess_excel = read_excel_excess_file(uploaded_excess_file)
-        df_service_excel = read_excel_service_file(uploaded_excess_file)
-        
-        con.register("df_excess_excel", df_excess_excel)
-        con.execute(f"DROP TABLE IF EXISTS {excess_table_name}")
-        con.execute(f"CREATE TABLE {excess_table_name} AS SELECT * FROM df_excess_excel")
+        ingest_excessoes(db_path, uploaded_excess_file)
+
+    with reader_connection(db_path) as con:
+        versoes = read_loaded_versions(con)
+        if not versoes.empty:
+            with st.sidebar.expander("Versões carregadas"):
+                st.dataframe(versoes, hide_index=True)
+                stats = cache_stats()
+                st.caption(
+                    f"Cache: {stats['hits']} acertos, {stats['misses']} faltas, "
+                    f"{stats['entries']} entradas ({stats['bytes'] / 1024 ** 2:.1f} MB)."
+                )
         
-        con.register("df_service_excel", df_service_excel)
-        con.execute(f"DROP TABLE IF EXISTS {service_table_name}")
-        con.execute(f"CREATE TABLE {service_table_name} AS SELECT * FROM df_service_excel")
-    
-    
-    df, df_melted, df_excess, df_weight, df_service ,colunas_datas = prepare_base_data(
-        con,
-        table_name="controle_cotacoes",
-        excess_table_name="excessoes",
-        weight_table_name="ponderacoes",
-        service_table_name="servicos"
+        (serie, colunas_datas,
+         df_comparativo, df_tab, df_cobertura, df_totais, df_insumos) = load_app_data(con, db_path)
+        geracao = get_data_generation(con)
+    formato = st.sidebar.selectbox(
+        "Formato dos downloads:", available_formats(), key="export_format",
+        help="CSV e Parquet são bem mais rápidos que Excel para extrações grandes (sem as cores)."
     )
-    df_comparativo = compute_comparative_data(df_melted)
-    df_comparativo = df_comparativo.sort_values(by='Data_dt')
-    
     target_date = df_comparativo["Data"].iloc[-1]
-    df_tab = prepare_quantity_table(df, df_excess, df_service)
     tab1, tab2, tab3 = st.tabs(["Visão Geral", "Série Histórica", "Comparativo Mensal"])
     display_visao_geral(
         tab1,
         df_comparativo,
         target_date,
         df_tab,
-        df_weight,
-        colunas_datas
+        df_cobertura,
+        colunas_datas,
+        db_path,
+        geracao,
+        formato
     )
-    display_series_historica(tab2, df, colunas_datas)
-    display_comparativo_mes(tab3, df, df_excess, df_service, colunas_datas)
+    display_series_historica(tab2, serie, db_path, geracao)
+    display_comparativo_mes(tab3, df_totais, df_insumos, colunas_datas, serie["ufs"], db_path, geracao, formato)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+"""
+Benchmark de build_index_pivot_table: compara a versão antiga (laço célula a célula
+com .loc) com a versão matricial, em uma pivot sintética de 5.000 itens x 7 UFs.
+
+Uso: python benchmarks/bench_index_pivot.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import build_index_pivot_table
+from config import SHEET_NAMES
+
+N_ITENS = 5000
+DATA = "01/2025"
+
+
+def get_criticidade(valor):
+    """Classificação célula a célula usada pela implementação anterior (referência)."""
+    try:
+        valor = float(valor)
+        if valor <= 25:
+            return "SuperCrítico"
+        elif valor <= 55:
+            return "Crítico"
+        elif valor <= 100:
+            return "Aceitável"
+        else:
+            return "Suficiente"
+    except (TypeError, ValueError):
+        return None
+
+
+def build_index_pivot_table_loop(df, locked_date, df_base):
+    """Implementação anterior, mantida aqui apenas como referência de desempenho."""
+    df_locked = df[["UF", "CodigoDescricao", locked_date, "Exceção"]].copy()
+    df_locked.rename(columns={locked_date: "Valor"}, inplace=True)
+    df_pivot = df_locked.pivot(index="CodigoDescricao", columns="UF", values="Valor")
+    df_pivot = df_pivot.fillna('-')
+    if "BR" in df_pivot.columns:
+        df_pivot = df_pivot.drop("BR", axis=1)
+
+    exception_mapping = df_base.drop_duplicates("CodigoDescricao").set_index("CodigoDescricao")["Exceção"]
+    criticidade_mapping = {"Suficiente": 1, "Aceitável": 2, "Crítico": 3, "SuperCrítico": 4}
+
+    def cell_to_index(val, codigo):
+        if exception_mapping.get(codigo, False):
+            return 0
+        if isinstance(val, (int, float)):
+            return criticidade_mapping.get(get_criticidade(val), np.nan)
+        return np.nan
+
+    df_index = df_pivot.copy()
+    for codigo in df_index.index:
+        for col in df_index.columns:
+            df_index.loc[codigo, col] = cell_to_index(df_index.loc[codigo, col], codigo)
+    return df_index
+
+
+def synthetic_base(n_itens: int) -> pd.DataFrame:
+    """Gera uma base no formato do df_tab com n_itens por UF, ~5% de exceções e ~2% de vazios."""
+    rng = np.random.default_rng(42)
+    itens = [f"{110000 + i} - ITEM {i}" for i in range(n_itens)]
+    df = pd.DataFrame({
+        "UF": np.repeat(SHEET_NAMES, n_itens),
+        "CodigoDescricao": np.tile(itens, len(SHEET_NAMES)),
+        DATA: rng.integers(0, 200, n_itens * len(SHEET_NAMES)).astype(float),
+    })
+    df.loc[rng.random(len(df)) < 0.02, DATA] = np.nan
+    excecao = rng.random(n_itens) < 0.05
+    df["Exceção"] = np.tile(excecao, len(SHEET_NAMES))
+    return df
+
+
+def timeit(func, *args, repeat=1):
+    melhor = float("inf")
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        resultado = func(*args)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main():
+    df = synthetic_base(N_ITENS)
+    t_loop, antigo = timeit(build_index_pivot_table_loop, df, DATA, df)
+    t_vec, novo = timeit(build_index_pivot_table, df, DATA, df, repeat=5)
+
+    esperado = antigo.astype(float).fillna(-1).astype(np.int8)
+    assert (esperado.to_numpy() == novo.to_numpy()).all(), "resultados divergentes"
+
+    print(f"Pivot sintética: {N_ITENS} itens x {len(SHEET_NAMES)} UFs")
+    print(f"  laço .loc (antigo): {t_loop:8.3f} s  ({antigo.memory_usage(deep=True).sum() / 1e6:.2f} MB, object)")
+    print(f"  matricial (novo):   {t_vec:8.3f} s  ({novo.memory_usage(deep=True).sum() / 1e6:.2f} MB, int8)")
+    print(f"  ganho: {t_loop / t_vec:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark da leitura da planilha de ponderações (todas as abas, cabeçalho na 2ª linha),
+o caminho de read_excel_weight_file. Compara a leitura antiga (um pd.read_excel por aba,
+reabrindo o arquivo) com read_workbook_sheets no processo atual (padrão), com um pool
+de processos pedido explicitamente e com o backend calamine.
+
+Uso: python benchmarks/bench_workbook_reader.py caminho/ponderacoes.xlsx [processos]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from excel_reader import read_workbook_sheets, default_engine
+
+
+def read_sheets_legacy(path):
+    """Leitura anterior: o arquivo é reaberto e reprocessado a cada aba."""
+    xls = pd.ExcelFile(path)
+    return {sheet: pd.read_excel(path, sheet_name=sheet, skiprows=1) for sheet in xls.sheet_names}
+
+
+def timeit(func, repeat=3):
+    melhor = float("inf")
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        resultado = func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[1]
+    processos = int(sys.argv[2]) if len(sys.argv) > 2 else max(os.cpu_count() or 1, 2)
+
+    t_legacy, esperado = timeit(lambda: read_sheets_legacy(path))
+    cenarios = [
+        ("openpyxl, processo atual", lambda: read_workbook_sheets(path, engine="openpyxl", skiprows=1)),
+        (f"openpyxl, {processos} processos", lambda: read_workbook_sheets(path, engine="openpyxl",
+                                                                         max_workers=processos, skiprows=1)),
+    ]
+    if default_engine() == "calamine":
+        cenarios.append(("calamine, processo atual", lambda: read_workbook_sheets(path, engine="calamine",
+                                                                                  skiprows=1)))
+
+    linhas = sum(len(df) for df in esperado.values())
+    print(f"{os.path.basename(path)}: {os.path.getsize(path) / 1e6:.1f} MB, {len(esperado)} abas, "
+          f"{linhas} linhas, {os.cpu_count() or 1} CPU(s)")
+    print(f"  {'pd.read_excel por aba (antigo)':34s} {t_legacy:7.2f} s")
+    for nome, func in cenarios:
+        t, resultado = timeit(func)
+        for sheet, df in esperado.items():
+            pd.testing.assert_frame_equal(df, resultado[sheet])
+        print(f"  {nome:34s} {t:7.2f} s  ({t_legacy / t:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
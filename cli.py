@@ -0,0 +1,121 @@
+import argparse
+import os
+import sys
+
+from config import DB_PATH
+from core import (
+    open_database,
+    ingest_cotacoes,
+    ingest_ponderacoes,
+    ingest_excessoes,
+    rebuild_summaries,
+    load_app_data,
+    latest_status,
+    item_comparison_detail
+)
+from reports import render_uf_reports
+from quantile_stats import JANELAS, read_quantile_stats
+from exports import EXPORT_FORMATS, available_formats, export_bytes, export_file_name
+from connection import reader_connection, close_database
+
+
+def cmd_ingest(args):
+    """Carrega os arquivos informados, na ordem cotações, ponderações, exceções."""
+    if not (args.cotacoes or args.ponderacoes or args.excessoes):
+        sys.exit("Informe ao menos um arquivo (--cotacoes, --ponderacoes ou --excessoes).")
+
+    if args.cotacoes:
+        contagem = ingest_cotacoes(args.db, args.cotacoes)
+        if contagem is None:
+            print(f"Cotações: {args.cotacoes} já carregado.")
+        else:
+            print(f"Cotações: {contagem['inseridas']} inseridas, {contagem['atualizadas']} atualizadas, "
+                  f"{contagem['inalteradas']} inalteradas, {contagem['removidas']} removidas.")
+    for rotulo, ingest, caminho in [
+        ("Ponderações", ingest_ponderacoes, args.ponderacoes),
+        ("Exceções", ingest_excessoes, args.excessoes),
+    ]:
+        if caminho:
+            linhas = ingest(args.db, caminho)
+            print(f"{rotulo}: {caminho} já carregado." if linhas is None else f"{rotulo}: {linhas} linhas lidas.")
+
+
+def cmd_rebuild(args):
+    rebuild_summaries(args.db)
+    print("Flags por item e resumos recalculados.")
+
+
+def _write(df, pasta, base, formato, sheet_name, value_columns=(), category_column=None):
+    caminho = os.path.join(pasta, export_file_name(base, formato))
+    with open(caminho, "wb") as f:
+        f.write(export_bytes(df, formato, sheet_name, value_columns, category_column))
+    print(caminho)
+
+
+def cmd_export(args):
+    """Gera os mesmos relatórios das abas: status, tabela consolidada por UF, cobertura e comparativo."""
+    if args.formato not in available_formats():
+        sys.exit(f"Formato indisponível neste ambiente: {args.formato}")
+    os.makedirs(args.saida, exist_ok=True)
+
+    with reader_connection(args.db) as con:
+        (_, _, df_comparativo, df_tab, df_cobertura,
+         df_totais, df_insumos) = load_app_data(con, args.db)
+        quantis = {janela: read_quantile_stats(con, janela) for janela in JANELAS}
+
+    ufs = args.uf or sorted(uf for uf in df_tab["UF"].unique() if uf != "BR")
+    pasta, formato = args.saida, args.formato
+
+    _write(latest_status(df_comparativo), pasta, "status_ultimo_mes", formato, "Status")
+    # Tabelas consolidadas por UF e cobertura BR, em paralelo (ver reports.render_uf_reports)
+    resultado = render_uf_reports(df_cobertura, ufs, pasta, formato, max_workers=args.workers)
+    for caminho in resultado["arquivos"]:
+        print(caminho)
+    print(f"{len(resultado['arquivos'])} relatórios de cobertura em {resultado['segundos']:.2f} s "
+          f"({resultado['processos']} processo(s)).")
+    if df_insumos is not None and not df_insumos.empty:
+        _write(item_comparison_detail(df_insumos), pasta, "comparativo_atual_vs_anterior_detalhe_por_insumo",
+               formato, "Comparativo_Insumo_BR")
+    _write(df_totais[["Data", "Total"]], pasta, "agregado_total_mes_a_mes", formato, "Agregado_Mensal")
+    for janela, df_quantis in quantis.items():
+        _write(df_quantis.drop(columns="Data_dt"), pasta, f"quantis_por_uf_janela_{janela}", formato, "Quantis_UF")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Cargas e relatórios do controle de cotações do IPC, sem a interface web."
+    )
+    parser.add_argument("--db", default=DB_PATH, help=f"Banco DuckDB (padrão: {DB_PATH}).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="Carrega planilhas de cotações, ponderações e/ou exceções.")
+    p_ingest.add_argument("--cotacoes", help="Planilha de controle de cotações.")
+    p_ingest.add_argument("--ponderacoes", help="Planilha de ponderações.")
+    p_ingest.add_argument("--excessoes", help="Planilha de itens com excessões.")
+    p_ingest.set_defaults(func=cmd_ingest)
+
+    p_rebuild = sub.add_parser("rebuild-summaries", help="Recalcula flags por item e resumos materializados.")
+    p_rebuild.set_defaults(func=cmd_rebuild)
+
+    p_export = sub.add_parser("export", help="Gera os relatórios das abas em arquivos.")
+    p_export.add_argument("--saida", default="relatorios", help="Pasta de destino (padrão: relatorios).")
+    p_export.add_argument("--formato", default="Excel", choices=list(EXPORT_FORMATS))
+    p_export.add_argument("--uf", nargs="+", help="UFs da tabela consolidada (padrão: todas).")
+    p_export.add_argument("--workers", type=int,
+                          help="Processos para os relatórios por UF (padrão: no processo atual, "
+                               "ou um por núcleo em coberturas grandes).")
+    p_export.set_defaults(func=cmd_export)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    open_database(args.db)
+    try:
+        args.func(args)
+    finally:
+        close_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,8 @@
-import streamlit as st
-
-st.set_page_config(
-    page_title="Leitor de Controle de Cotações - IPC",
-    page_icon="../assets/logo_fgv.png"
-)
-
-#st.logo("../assets/logo_ibre.png")
-
 SHEET_NAMES = ["SP", "RS", "RJ", "PE", "MG", "DF", "BA"]
+
+# Banco e tabelas de origem das cargas
+DB_PATH = "ipc.db"
+TABLE_NAME = "controle_cotacoes"
+EXCESS_TABLE_NAME = "excessoes"
+SERVICE_TABLE_NAME = "servicos"
+WEIGHT_TABLE_NAME = "ponderacoes"
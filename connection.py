@@ -0,0 +1,87 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+# Quantidade máxima de cursores de leitura guardados para reúso por banco
+MAX_READERS = 8
+
+_lock = threading.Lock()
+_bancos = {}
+
+
+def get_database(db_path: str, setup=None) -> dict:
+    """
+    Abre o banco uma única vez por processo e retorna o estado compartilhado:
+    a conexão de escrita, o lock de escrita e o pool de cursores de leitura.
+    setup(con), se informado, roda uma vez na abertura (ex.: database.prepare_database).
+    """
+    with _lock:
+        banco = _bancos.get(db_path)
+        if banco is None:
+            con = duckdb.connect(db_path)
+            if setup is not None:
+                setup(con)
+            banco = {"con": con, "write_lock": threading.Lock(), "readers": queue.LifoQueue(MAX_READERS)}
+            _bancos[db_path] = banco
+        return banco
+
+
+@contextmanager
+def writer_connection(db_path: str):
+    """
+    Conexão de escrita, usada só nas cargas de arquivos. Uma carga por vez: o lock
+    serializa as escritas de todas as sessões do processo.
+    """
+    banco = get_database(db_path)
+    with banco["write_lock"]:
+        yield banco["con"]
+
+
+@contextmanager
+def write_transaction(db_path: str):
+    """Conexão de escrita dentro de uma transação: confirma ao final ou desfaz em caso de erro."""
+    with writer_connection(db_path) as con:
+        con.execute("BEGIN TRANSACTION")
+        try:
+            yield con
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+
+@contextmanager
+def reader_connection(db_path: str):
+    """
+    Cursor de leitura do pool, dentro de uma transação: todas as consultas feitas nele
+    enxergam o mesmo snapshot do banco, mesmo que uma carga seja confirmada no meio.
+    Leituras não esperam pelas escritas (MVCC do DuckDB).
+    """
+    banco = get_database(db_path)
+    try:
+        cursor = banco["readers"].get_nowait()
+    except queue.Empty:
+        cursor = banco["con"].cursor()
+
+    cursor.execute("BEGIN TRANSACTION")
+    try:
+        yield cursor
+    finally:
+        cursor.execute("ROLLBACK")
+        try:
+            banco["readers"].put_nowait(cursor)
+        except queue.Full:
+            cursor.close()
+
+
+def close_database(db_path: str):
+    """Fecha os cursores e a conexão do banco (ex.: ao final de uma execução em lote)."""
+    with _lock:
+        banco = _bancos.pop(db_path, None)
+    if banco is None:
+        return
+    while not banco["readers"].empty():
+        banco["readers"].get_nowait().close()
+    banco["con"].close()
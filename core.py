@@ -0,0 +1,268 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import SHEET_NAMES, TABLE_NAME, EXCESS_TABLE_NAME, SERVICE_TABLE_NAME, WEIGHT_TABLE_NAME
+from utils import CATEGORIA_NENHUMA, CATEGORIA_EXCECAO, CATEGORIA_SERVICO, CATEGORIA_ESPECIAL
+from data_processing import (
+    iter_controle_batches,
+    read_excel_excess_service_file,
+    read_excel_weight_file
+)
+from database import (
+    refresh_item_flags,
+    prepare_database,
+    file_sha256,
+    is_current_version,
+    record_ingest,
+    get_date_columns,
+    read_series_dimensions,
+    query_series,
+    get_data_generation,
+    bump_data_generation,
+    refresh_summaries,
+    read_status_summary,
+    read_monthly_totals,
+    read_item_comparison,
+    read_top_changes,
+    read_latest_month,
+    query_coverage,
+    store_weights
+)
+from data_update import atualizar_base_streaming
+from quantile_stats import ensure_quantile_stats, refresh_quantile_stats, read_quantile_stats
+from excel_reader import workbook_bytes
+from filters import apply_filters
+from connection import get_database, write_transaction, reader_connection
+from result_cache import get_or_compute
+
+# Itens destacados em roxo na tabela consolidada, independentemente da criticidade
+SPECIAL_PREFIXES = [
+    "280107", "280501",
+    "350101",
+    "410301", "410305", "410307", "410319"
+]
+
+def open_database(db_path: str) -> dict:
+    """Abre o banco (uma vez por processo) já com o esquema, resumos e tabelas auxiliares prontos."""
+    def setup(con):
+        if prepare_database(con, TABLE_NAME):
+            refresh_quantile_stats(con)
+        else:
+            ensure_quantile_stats(con)
+    return get_database(db_path, setup=setup)
+
+def _file_name(source) -> str:
+    """Nome do arquivo de origem: o do upload ou o do caminho."""
+    nome = getattr(source, "name", None)
+    if nome is None and isinstance(source, (str, os.PathLike)):
+        nome = os.path.basename(source)
+    return nome or "arquivo"
+
+def _pendente(db_path: str, base: str, sha: str) -> bool:
+    with reader_connection(db_path) as con:
+        return not is_current_version(con, base, sha)
+
+# Arquivos já carregados (mesmo SHA-256 da última carga da base) não são relidos nem regravados:
+# as funções de carga abaixo retornam None nesse caso.
+
+def ingest_cotacoes(db_path: str, source):
+    """
+    Carrega a planilha de controle de cotações (upload, caminho ou bytes) em lotes.
+    A carga, os resumos, o ingest_log e a nova geração são confirmados numa única transação.
+    Retorna a contagem de linhas inseridas/atualizadas/inalteradas/removidas (ver data_update).
+    """
+    data = workbook_bytes(source)
+    sha = file_sha256(data)
+    if not _pendente(db_path, "cotacoes", sha):
+        return None
+    with write_transaction(db_path) as con:
+        contagem = atualizar_base_streaming(con, iter_controle_batches(data))
+        record_ingest(con, "cotacoes", sha, _file_name(source),
+                      SHEET_NAMES, contagem["linhas_lidas"], contagem)
+    return contagem
+
+def ingest_ponderacoes(db_path: str, source):
+    """Substitui as ponderações pelas da planilha. Retorna a quantidade de linhas lidas."""
+    data = workbook_bytes(source)
+    sha = file_sha256(data)
+    if not _pendente(db_path, "ponderacoes", sha):
+        return None
+    df_weight = read_excel_weight_file(data)
+    with write_transaction(db_path) as con:
+        store_weights(con, df_weight, WEIGHT_TABLE_NAME)
+        record_ingest(con, "ponderacoes", sha, _file_name(source),
+                      df_weight["UF"].unique(), len(df_weight))
+    return len(df_weight)
+
+def ingest_excessoes(db_path: str, source):
+    """
+    Substitui as listas de exceções e serviços pelas da planilha e recalcula as flags
+    por item e os resumos. Retorna a quantidade de itens lidos.
+    """
+    data = workbook_bytes(source)
+    sha = file_sha256(data)
+    if not _pendente(db_path, "excessoes", sha):
+        return None
+    df_excess, df_service = read_excel_excess_service_file(data)
+    with write_transaction(db_path) as con:
+        con.register("df_excess_excel", df_excess)
+        con.execute(f"DROP TABLE IF EXISTS {EXCESS_TABLE_NAME}")
+        con.execute(f"CREATE TABLE {EXCESS_TABLE_NAME} AS SELECT * FROM df_excess_excel")
+
+        con.register("df_service_excel", df_service)
+        con.execute(f"DROP TABLE IF EXISTS {SERVICE_TABLE_NAME}")
+        con.execute(f"CREATE TABLE {SERVICE_TABLE_NAME} AS SELECT * FROM df_service_excel")
+        refresh_item_flags(con, EXCESS_TABLE_NAME, SERVICE_TABLE_NAME)
+        refresh_summaries(con)
+        record_ingest(con, "excessoes", sha, _file_name(source),
+                      ["itens com excessões"], len(df_excess) + len(df_service))
+    return len(df_excess) + len(df_service)
+
+def rebuild_summaries(db_path: str):
+    """
+    Recalcula as flags por item e todos os resumos materializados, incluindo os quantis
+    (ex.: após ajustes manuais no banco, que podem ter alterado qualquer quantidade).
+    """
+    with write_transaction(db_path) as con:
+        refresh_item_flags(con, EXCESS_TABLE_NAME, SERVICE_TABLE_NAME)
+        refresh_summaries(con)
+        refresh_quantile_stats(con)
+        bump_data_generation(con)
+
+def prepare_base_data(con):
+    """
+    Consulta as tabelas no banco de dados e prepara:
+      - serie: dimensões (UFs e itens) das opções da aba de séries (ver
+        database.read_series_dimensions); as séries são consultadas por seleção (load_series).
+      - colunas_datas: Colunas com datas.
+    """
+    colunas_datas = get_date_columns(con)
+    serie = read_series_dimensions(con)
+
+    return serie, colunas_datas
+
+def series_key(ufs, grupos=None, itens=None) -> tuple:
+    """Chave de cache de uma seleção de séries (independente da ordem de escolha)."""
+    return tuple(sorted(ufs)), tuple(sorted(grupos or ())), tuple(sorted(itens or ()))
+
+def load_series(con, db_path, ufs, grupos=None, itens=None) -> pd.DataFrame:
+    """
+    Série histórica da seleção (média por mês), com índice Data_dt e colunas (UF, CodigoDescricao),
+    consultada no banco só para as UFs, grupos e itens pedidos (database.query_series).
+    O resultado fica no cache de resultados por banco, geração dos dados e seleção, com remoção LRU.
+    """
+    chave = (db_path, "serie") + series_key(ufs, grupos, itens)
+
+    def calcular():
+        df = query_series(con, ufs, grupos, itens)
+        if df.empty:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="Data_dt"))
+        return df.pivot_table(index="Data_dt", columns=["UF", "CodigoDescricao"], values="Valor", aggfunc="mean")
+
+    return get_or_compute(get_data_generation(con), chave, calcular)
+
+def load_app_data(con, db_path):
+    """
+    Monta os dados usados pelas abas (dimensões das séries, datas, status por UF/mês,
+    tabela de quantidades, cobertura quantidade x ponderação de todas as UFs e
+    comparativo mensal) uma vez por geração dos dados.
+    Status, totais mensais e o último mês vêm dos resumos materializados na carga.
+    O resultado fica no cache do processo e é reaproveitado por todas as sessões
+    até a próxima carga de arquivo.
+    """
+    def calcular():
+        serie, colunas_datas = prepare_base_data(con)
+        df_comparativo = read_status_summary(con)
+        # Tabela da aba "Controle de Cotações", já com CodigoDescricao, Grupo e flags vindos do banco
+        df_tab = read_latest_month(con, detalhes=True)
+        df_cobertura = query_coverage(con)
+        df_totais = read_monthly_totals(con)
+        df_insumos = (
+            read_item_comparison(con, colunas_datas[-1], colunas_datas[-2])
+            if len(colunas_datas) >= 2 else None
+        )
+        return serie, colunas_datas, df_comparativo, df_tab, df_cobertura, df_totais, df_insumos
+
+    return get_or_compute(get_data_generation(con), (db_path, "app_data"), calcular)
+
+def load_item_comparison(con, db_path, data_atual: str, data_anterior: str, uf: str = "BR") -> pd.DataFrame:
+    """Comparação por item de qualquer par de meses na UF (database.read_item_comparison), em cache por geração."""
+    return get_or_compute(
+        get_data_generation(con), (db_path, "comparacao", data_atual, data_anterior, uf),
+        lambda: read_item_comparison(con, data_atual, data_anterior, uf)
+    )
+
+def load_top_changes(con, db_path, data: str, base: str = "mes", uf: str = "BR", k: int = 20) -> pd.DataFrame:
+    """Maiores quedas do mês (database.read_top_changes), em cache por geração."""
+    return get_or_compute(
+        get_data_generation(con), (db_path, "maiores_quedas", data, base, uf, k),
+        lambda: read_top_changes(con, data, base, uf, k)
+    )
+
+def load_quantile_stats(con, db_path, janela: int = 1) -> pd.DataFrame:
+    """Quantis por UF e mês de todo o histórico (quantile_stats.read_quantile_stats), em cache por geração."""
+    return get_or_compute(
+        get_data_generation(con), (db_path, "quantis", janela),
+        lambda: read_quantile_stats(con, janela)
+    )
+
+def item_categories(df):
+    """
+    Código de categoria (utils.CATEGORIA_*) de cada linha, a partir de CodigoDescricao e das
+    flags Serviço/Exceção, na precedência da tela: especial > serviço > exceção.
+    """
+    return np.select(
+        [
+            df["CodigoDescricao"].str.startswith(tuple(SPECIAL_PREFIXES)).to_numpy(dtype=bool),
+            df["Serviço"].to_numpy(dtype=bool),
+            df["Exceção"].to_numpy(dtype=bool),
+        ],
+        [CATEGORIA_ESPECIAL, CATEGORIA_SERVICO, CATEGORIA_EXCECAO],
+        default=CATEGORIA_NENHUMA,
+    )
+
+def latest_status(df_comparativo: pd.DataFrame) -> pd.DataFrame:
+    """Status por UF no mês mais recente (aba "Visão de Status por Quantidade")."""
+    df_recent = df_comparativo[df_comparativo["Data_dt"] == df_comparativo["Data_dt"].max()]
+    return df_recent[["UF", "Data", "Total", "SuperCrítico", "Crítico",
+                      "Aceitável", "Suficiente", "Exceção", "Serviços"]]
+
+def consolidated_table(df_cobertura: pd.DataFrame, uf: str, filtros=None, criticidade=None) -> tuple:
+    """
+    Tabela consolidada de uma UF (aba "Controle de Cotações"): quantidade no último mês,
+    prioridade e falta para a cobertura mínima, das mais críticas e mais ponderadas para
+    as demais. filtros ({coluna: valores}) e criticidade seguem filters.apply_filters.
+    Retorna (tabela, categoria de cada linha); a coluna de quantidade chama '<UF>_qtd'.
+    """
+    filtros = {**(filtros or {}), "UF": [uf] if uf else []}
+    df_sel = apply_filters(df_cobertura, filtros, criticidade, "Quantidade")
+    qtd_col = f"{uf}_qtd"
+    df_sorted = (
+        df_sel.sort_values(by=["CriticidadeNivel", "Ponderação"], ascending=[False, False])
+              .rename(columns={"Quantidade": qtd_col})
+              .reset_index(drop=True)
+    )
+    df_display = df_sorted[["CodigoDescricao", qtd_col, "Prioridade", "Falta p/ Cobertura Mínima"]]
+    return df_display, item_categories(df_sorted)
+
+def national_coverage(df_cobertura: pd.DataFrame) -> pd.DataFrame:
+    """Cobertura de todas as UFs numa só tabela, com a coluna Categoria (utils.CATEGORIA_*)."""
+    df_nacional = df_cobertura.sort_values(
+        by=["UF", "CriticidadeNivel", "Ponderação"], ascending=[True, False, False], kind="stable"
+    )
+    return df_nacional[["UF", "CodigoDescricao", "Quantidade", "Ponderação", "Criticidade",
+                        "Prioridade", "Falta p/ Cobertura Mínima"]].assign(
+        Categoria=item_categories(df_nacional)
+    )
+
+def item_comparison_detail(df_insumos: pd.DataFrame) -> pd.DataFrame:
+    """Detalhe por insumo do comparativo atual x anterior, da pior queda para a maior alta."""
+    agg = df_insumos.copy()
+
+    agg["Diferença"] = agg["Qtd_Atual"] - agg["Qtd_Anterior"]
+    den = agg["Qtd_Anterior"].replace({0: np.nan})
+    agg["Diferença (%)"] = (agg["Diferença"] / den) * 100
+
+    return agg.sort_values(by=["Diferença", "Qtd_Atual"], ascending=[True, True]).reset_index(drop=True)
@@ -1,85 +1,111 @@
 import pandas as pd
 import re
 import datetime
-import streamlit as st
 from config import SHEET_NAMES
+from excel_reader import read_workbook_sheets, iter_workbook_rows
 
-@st.cache_data
-def read_excel_file(uploaded_file) -> pd.DataFrame:
-    """Lê e processa o arquivo Excel principal com várias abas."""
-    lista_dfs = []
-    for sheet in SHEET_NAMES:
-        df_sheet = pd.read_excel(
-            uploaded_file,
-            sheet_name=sheet,
-            skiprows=6
-        )
-        df_sheet["Capital"] = sheet
-        lista_dfs.append(df_sheet)
-    
-    df = pd.concat(lista_dfs, ignore_index=True)
-    df = df.dropna(axis=1, how='all')
-    df.rename(columns={'Capital': 'UF'}, inplace=True)
-    df.columns = [re.sub(r'\s*\(Q.*\)', '', col) for col in df.columns]
+CONTROLE_SKIPROWS = 6
+CONTROLE_BATCH_SIZE = 5000
 
-    data_atual = datetime.datetime.now()
+def clean_header(colunas, data_atual=None) -> list:
+    """
+    Aplica a limpeza de cabeçalho da planilha de controle uma única vez sobre a linha de
+    cabeçalho: remove o sufixo '(Q...)' e descarta os meses anteriores a 2024 ou futuros.
+    Retorna a lista [(posição, nome)] das colunas mantidas.
+    """
+    data_atual = data_atual or datetime.datetime.now()
     cols_to_keep = []
-    for col in df.columns:
+    for pos, col in enumerate(colunas):
+        if col is None:
+            continue
+        col = re.sub(r'\s*\(Q.*\)', '', str(col))
         match = re.search(r'(\d{2}/\d{4})', col)
         if match:
             try:
                 data_coluna = datetime.datetime.strptime(match.group(1), "%m/%Y")
                 if data_coluna.year >= 2024 and data_coluna <= data_atual:
-                    cols_to_keep.append(col)
+                    cols_to_keep.append((pos, col))
             except Exception:
                 pass
         else:
-            cols_to_keep.append(col)
-    df = df[cols_to_keep]
-    return df
+            cols_to_keep.append((pos, col))
+    return cols_to_keep
 
-@st.cache_data
-def read_excel_excess_file(upload_file) -> pd.DataFrame:
-    """Lê e processa o arquivo Excel de excessões."""
-    df_sheet = pd.read_excel(upload_file, sheet_name='itens com excessões')
-    df_excecao = df_sheet[df_sheet["excessão"].notna()][["DESCRIÇÃO"]]
-    return df_excecao
+def cell_number(valor):
+    """
+    Converte uma célula para float como o pd.to_numeric(errors="coerce") da leitura por
+    DataFrame: números e textos numéricos (ex.: "12", " 12 ") viram float; vazios, textos
+    não numéricos (ex.: "-", "12,5") e NaN viram None.
+    """
+    if isinstance(valor, str):
+        if "_" in valor:
+            return None
+        try:
+            valor = float(valor.strip())
+        except ValueError:
+            return None
+    elif not isinstance(valor, (int, float)):
+        return None
+    valor = float(valor)
+    return None if valor != valor else valor
+
+def iter_controle_batches(uploaded_file, batch_size=CONTROLE_BATCH_SIZE):
+    """
+    Lê a planilha de controle em streaming e gera lotes de no máximo batch_size células
+    no formato longo (UF, Código, Descrição, ref_month, Valor, _ordem). A limpeza do
+    cabeçalho é feita uma vez por aba; textos numéricos são convertidos (ver cell_number)
+    e células vazias ou não numéricas vão com Valor nulo, para que a carga apague o valor
+    gravado dessa célula (ver database.apply_cotacoes_stage).
+    """
+    colunas_lote = ["UF", "Código", "Descrição", "ref_month", "Valor", "_ordem"]
+    lote = []
+    ordem = 0
+    cabecalho = {}
 
+    for sheet, row in iter_workbook_rows(uploaded_file, SHEET_NAMES, skiprows=CONTROLE_SKIPROWS):
+        if sheet not in cabecalho:
+            colunas = dict((col, pos) for pos, col in clean_header(row))
+            meses = [
+                (pos, datetime.datetime.strptime(re.search(r'(\d{2}/\d{4})', col).group(1), "%m/%Y").date())
+                for col, pos in colunas.items() if re.search(r'(\d{2}/\d{4})', col)
+            ]
+            cabecalho[sheet] = (colunas.get("Código"), colunas.get("Descrição"), meses)
+            continue
 
+        pos_codigo, pos_descricao, meses = cabecalho[sheet]
+        if pos_codigo is None or row[pos_codigo] is None:
+            continue
+        ordem += 1
+        descricao = row[pos_descricao] if pos_descricao is not None else None
+        for pos, ref_month in meses:
+            valor = cell_number(row[pos]) if pos < len(row) else None
+            lote.append((sheet, row[pos_codigo], descricao, ref_month, valor, ordem))
+        if len(lote) >= batch_size:
+            yield pd.DataFrame(lote, columns=colunas_lote)
+            lote = []
 
-def read_excel_service_file(upload_file) -> pd.DataFrame:
-    """Lê e processa o arquivo Excel de serviços."""
-    df_sheet = pd.read_excel(upload_file, sheet_name='itens com excessões')
+    if lote:
+        yield pd.DataFrame(lote, columns=colunas_lote)
+
+def read_excel_excess_service_file(upload_file) -> tuple:
+    """
+    Lê a aba 'itens com excessões' uma única vez e separa:
+      - df_excecao: itens marcados como exceção.
+      - df_servicos: itens de serviço que não são exceção.
+    """
+    df_sheet = read_workbook_sheets(upload_file, ['itens com excessões'])['itens com excessões']
+    df_excecao = df_sheet[df_sheet["excessão"].notna()][["DESCRIÇÃO"]]
     df_servicos = df_sheet[
         (df_sheet["serviços?"] == "Serviço") & 
         (df_sheet["excessão"].isna())
     ][["DESCRIÇÃO"]]
-    return df_servicos
-
-def atualizar_base_incremental(df_atual: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
-    colunas_datas_atual = df_atual.columns[3:]
-    colunas_datas_new = new_df.columns[3:]
-    
-    novas_colunas = [col for col in colunas_datas_new if col not in colunas_datas_atual]
-    
-    if novas_colunas:
-        chaves = ["UF", "Código", "Descrição"]
-        df_atual = df_atual.set_index(chaves)
-        new_data = new_df.set_index(chaves)[novas_colunas]
-        
-        df_atual = df_atual.join(new_data, how="left")
-        df_atual = df_atual.reset_index()
-    
-    return df_atual
+    return df_excecao, df_servicos
 
-@st.cache_data
 def read_excel_weight_file(upload_file) -> pd.DataFrame:
-    xls = pd.ExcelFile(upload_file)
-    sheets = xls.sheet_names
+    sheets = read_workbook_sheets(upload_file, skiprows=1)
     list_dfs = []
 
-    for sheet in sheets:
-        df_sheet = pd.read_excel(upload_file, sheet_name=sheet, skiprows=1)
+    for sheet, df_sheet in sheets.items():
         df_sem_coluna = df_sheet.drop('Cód.Série - Nr.Índice', axis=1)
         novas_colunas = df_sem_coluna.columns.tolist()
         for i in range(1, len(novas_colunas)):
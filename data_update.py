@@ -1,17 +1,37 @@
-import pandas as pd
+from database import (
+    refresh_item_flags, begin_cotacoes_stage, stage_long_batch, apply_cotacoes_stage, refresh_summaries,
+)
+from quantile_stats import refresh_quantile_stats
 
-def atualizar_base_incremental(df_atual: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
-    colunas_datas_atual = df_atual.columns[3:]
-    colunas_datas_new = new_df.columns[3:]
-    
-    novas_colunas = [col for col in colunas_datas_new if col not in colunas_datas_atual]
-    
-    if novas_colunas:
-        chaves = ["UF", "Código", "Descrição"]
-        df_atual = df_atual.set_index(chaves)
-        new_data = new_df.set_index(chaves)[novas_colunas]
-        
-        df_atual = df_atual.join(new_data, how="left")
-        df_atual = df_atual.reset_index()
-    
-    return df_atual
+def atualizar_derivados(con, contagem: dict):
+    """
+    Atualiza, na transação da carga, o que é derivado das cotações: as flags dos itens
+    novos, os resumos materializados dos meses alterados e os quantis por UF das janelas
+    que contêm esses meses.
+    Um item renomeado pode mudar de flag (as listas de exceções usam a descrição), e com
+    isso a contagem por criticidade de todos os meses: nesse caso os resumos são refeitos.
+    """
+    if contagem["inseridas"] or contagem["renomeados"]:
+        refresh_item_flags(con)
+    refresh_summaries(con, None if contagem["renomeados"] else contagem["meses"])
+    if contagem["meses"]:
+        refresh_quantile_stats(con, contagem["meses"])
+
+def atualizar_base_streaming(con, batches) -> dict:
+    """
+    Atualiza a base de cotações de forma incremental: insere os (UF, Código, mês) novos,
+    atualiza os que mudaram e mantém os meses que não estão na nova planilha. É alimentada
+    por lotes no formato longo (ver data_processing.iter_controle_batches): cada lote vai
+    direto para o staging no DuckDB, sem montar a planilha inteira em memória.
+    Não abre transação: deve rodar na mesma transação que registra a carga (ver
+    core.ingest_cotacoes), para que dados, ingest_log e geração sejam confirmados juntos.
+    Retorna as contagens do upsert e o total de linhas da planilha com valores ("linhas_lidas").
+    """
+    linhas_lidas = 0
+    begin_cotacoes_stage(con)
+    for lote in batches:
+        stage_long_batch(con, lote)
+        linhas_lidas += lote.loc[lote["Valor"].notna(), "_ordem"].nunique()
+    contagem = apply_cotacoes_stage(con)
+    atualizar_derivados(con, contagem)
+    return {**contagem, "linhas_lidas": linhas_lidas}
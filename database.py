@@ -0,0 +1,1018 @@
+import pandas as pd
+import re
+import hashlib
+
+from matcher import match_flags
+from utils import (
+    CRITICIDADE_BINS, CRITICIDADE_ROTULOS, PRIORIDADE_LIMITES, PRIORIDADE_PADRAO, COBERTURA_MINIMA
+)
+
+ITEM_FLAGS_TABLE = "itens_flags"
+UF_TABLE = "dim_uf"
+ITEM_TABLE = "dim_item"
+FACT_TABLE = "fato_cotacoes"
+INGEST_LOG_TABLE = "ingest_log"
+GENERATION_TABLE = "data_generation"
+STATUS_SUMMARY_TABLE = "resumo_status"
+ITEM_MONTH_SUMMARY_TABLE = "resumo_item_mes"
+MONTH_SUMMARY_TABLE = "resumo_mensal"
+LATEST_MONTH_TABLE = "resumo_ultimo_mes"
+DELTA_TABLE = "resumo_variacoes"
+WEIGHT_TABLE = "ponderacoes"
+ID_COLUMNS = ["UF", "Código", "Descrição"]
+
+# Capitais das abas da planilha de ponderações -> UF usada no restante da aplicação
+CAPITAL_TO_UF = {
+    "Belo Horizonte": "MG",
+    "Brasília": "DF",
+    "Porto Alegre": "RS",
+    "Recife": "PE",
+    "Rio de Janeiro": "RJ",
+    "Salvador": "BA",
+    "São Paulo": "SP",
+    "BR": "BR",
+}
+
+
+def quote_identifier(name: str) -> str:
+    """Coloca um nome de coluna/tabela entre aspas duplas para uso em SQL."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def table_exists(con, table_name: str) -> bool:
+    """Verifica se a tabela existe no banco DuckDB."""
+    result = con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?",
+        [table_name]
+    ).fetchone()
+    return result[0] > 0
+
+
+def read_descricoes(con, table_name: str) -> list:
+    """Retorna a lista de descrições de uma tabela de exceções/serviços (vazia se a tabela não existir)."""
+    if not table_exists(con, table_name):
+        return []
+    df = con.execute(f'SELECT "DESCRIÇÃO" FROM {table_name}').fetchdf()
+    return df["DESCRIÇÃO"].dropna().tolist()
+
+
+def refresh_item_flags(con, excess_table_name="excessoes", service_table_name="servicos"):
+    """
+    Resolve as listas de exceções e serviços contra a dimensão de itens (Código, Descrição)
+    e grava o resultado na tabela de flags. Deve ser chamada a cada carga da base de
+    cotações ou da base de exceções.
+    """
+    if not table_exists(con, ITEM_TABLE):
+        return
+
+    df_itens = con.execute(
+        f'SELECT item_id, codigo AS "Código", descricao AS "Descrição" FROM {ITEM_TABLE}'
+    ).fetchdf()
+    codigo_descricao = df_itens["Código"].astype(str) + " - " + df_itens["Descrição"].astype(str)
+
+    df_itens["Exceção"] = match_flags(codigo_descricao, read_descricoes(con, excess_table_name))
+    df_itens["Serviço"] = match_flags(codigo_descricao, read_descricoes(con, service_table_name))
+
+    con.register("df_itens_flags", df_itens)
+    con.execute(f"DROP TABLE IF EXISTS {ITEM_FLAGS_TABLE}")
+    con.execute(f"CREATE TABLE {ITEM_FLAGS_TABLE} AS SELECT * FROM df_itens_flags")
+    con.unregister("df_itens_flags")
+
+
+def create_normalized_schema(con):
+    """
+    Cria (se necessário) o esquema normalizado de cotações:
+      - dim_uf: uma linha por UF.
+      - dim_item: uma linha por Código, com a descrição mais recente e os níveis de agrupamento.
+      - fato_cotacoes: (uf_id, item_id, ref_month, quantidade), uma linha por célula preenchida.
+    """
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {UF_TABLE} (
+            uf_id SMALLINT PRIMARY KEY,
+            uf VARCHAR NOT NULL UNIQUE
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ITEM_TABLE} (
+            item_id INTEGER PRIMARY KEY,
+            codigo BIGINT NOT NULL UNIQUE,
+            descricao VARCHAR,
+            nivel1 VARCHAR,
+            nivel2 VARCHAR,
+            grupo VARCHAR
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {FACT_TABLE} (
+            uf_id SMALLINT NOT NULL,
+            item_id INTEGER NOT NULL,
+            ref_month DATE NOT NULL,
+            quantidade INTEGER,
+            PRIMARY KEY (uf_id, item_id, ref_month)
+        )
+    """)
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_{FACT_TABLE}_mes ON {FACT_TABLE} (ref_month)")
+
+
+def month_label_to_date(label: str):
+    """Converte um rótulo de coluna contendo 'mm/aaaa' em data (primeiro dia do mês); None se não houver data."""
+    match = re.search(r"(\d{2}/\d{4})", str(label))
+    return pd.to_datetime(match.group(1), format="%m/%Y").date() if match else None
+
+
+def wide_date_columns(colunas) -> list:
+    """Filtra, de uma lista de colunas de tabela larga, as que são rótulos de mês ('mm/aaaa')."""
+    return [c for c in colunas if c not in ID_COLUMNS and month_label_to_date(c) is not None]
+
+
+def get_wide_date_columns(con, table_name="controle_cotacoes") -> list:
+    """Retorna as colunas de data (rótulos com 'mm/aaaa') de uma tabela larga de cotações."""
+    colunas = con.execute(f"DESCRIBE {table_name}").fetchdf()["column_name"].tolist()
+    return wide_date_columns(colunas)
+
+
+def begin_cotacoes_stage(con):
+    """Cria a área temporária (staging) com as células (UF, Código, mês, valor) a gravar."""
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE _stage_raw (
+            "UF" VARCHAR,
+            "Código" BIGINT,
+            "Descrição" VARCHAR,
+            ref_month DATE,
+            "Valor" DOUBLE,
+            _ordem BIGINT
+        )
+    """)
+
+
+def stage_wide_source(con, source: str, date_cols: list):
+    """Acrescenta ao staging as células de uma fonte larga (tabela ou DataFrame registrado), via UNPIVOT."""
+    if not date_cols:
+        return
+    meses = pd.DataFrame({
+        "Data": date_cols,
+        "ref_month": [month_label_to_date(c) for c in date_cols],
+    })
+    on_sql = ", ".join(quote_identifier(c) for c in date_cols)
+
+    con.register("df_meses_wide", meses)
+    try:
+        con.execute(f"""
+            INSERT INTO _stage_raw
+            SELECT l."UF", TRY_CAST(l."Código" AS BIGINT), l."Descrição", m.ref_month, l."Valor", l._ordem
+            FROM (
+                SELECT * FROM (
+                    SELECT "UF", "Código", "Descrição", {on_sql}, ROW_NUMBER() OVER () AS _ordem
+                    FROM {source}
+                )
+                UNPIVOT ("Valor" FOR "Data" IN ({on_sql}))
+            ) l
+            JOIN df_meses_wide m ON m."Data" = l."Data"
+        """)
+    finally:
+        con.unregister("df_meses_wide")
+
+
+def stage_long_batch(con, df_batch: pd.DataFrame):
+    """Acrescenta ao staging um lote já no formato longo (UF, Código, Descrição, ref_month, Valor, _ordem)."""
+    con.register("df_stage_batch", df_batch)
+    try:
+        con.execute("""
+            INSERT INTO _stage_raw
+            SELECT "UF", TRY_CAST("Código" AS BIGINT), "Descrição", ref_month, "Valor", _ordem
+            FROM df_stage_batch
+        """)
+    finally:
+        con.unregister("df_stage_batch")
+
+
+def upsert_cotacoes(con, source: str, date_cols: list) -> dict:
+    """
+    Grava no esquema normalizado as células de uma fonte larga (tabela ou DataFrame registrado).
+    Ver apply_cotacoes_stage para a semântica do upsert.
+    """
+    begin_cotacoes_stage(con)
+    stage_wide_source(con, source, date_cols)
+    return apply_cotacoes_stage(con)
+
+
+def apply_cotacoes_stage(con) -> dict:
+    """
+    Aplica o staging ao esquema normalizado, chaveado por (UF, Código, mês): insere as
+    células novas, atualiza as que mudaram e apaga as que vieram vazias (Valor nulo) num
+    mês presente no staging. Meses e linhas ausentes do staging não alteram o que já está
+    no banco; células repetidas são somadas.
+    O item é identificado só pelo Código: uma descrição nova atualiza a do item existente
+    (vale a primeira descrição não vazia do staging para cada código).
+    Não abre transação: quem chama decide o escopo (ver data_update.atualizar_base_streaming).
+    Retorna a contagem de linhas inseridas, atualizadas, inalteradas e removidas, de itens
+    renomeados e os meses alterados.
+    """
+    create_normalized_schema(con)
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE _stage_cotacoes AS
+        SELECT "UF", "Código", ref_month,
+               CAST(SUM("Valor") AS INTEGER) AS quantidade, MIN(_ordem) AS _ordem
+        FROM _stage_raw
+        WHERE "Código" IS NOT NULL
+        GROUP BY "UF", "Código", ref_month
+    """)
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE _stage_itens AS
+        SELECT "Código", arg_min("Descrição", _ordem) AS "Descrição",
+               bool_or("Valor" IS NOT NULL) AS com_valor
+        FROM _stage_raw
+        WHERE "Código" IS NOT NULL
+        GROUP BY "Código"
+    """)
+
+    con.execute(f"""
+        INSERT INTO {UF_TABLE}
+        SELECT (SELECT COALESCE(MAX(uf_id), 0) FROM {UF_TABLE}) + ROW_NUMBER() OVER (ORDER BY MIN(s._ordem)),
+               s."UF"
+        FROM _stage_cotacoes s
+        WHERE s.quantidade IS NOT NULL AND s."UF" NOT IN (SELECT uf FROM {UF_TABLE})
+        GROUP BY s."UF"
+    """)
+    con.execute(f"""
+        INSERT INTO {ITEM_TABLE}
+        SELECT (SELECT COALESCE(MAX(item_id), 0) FROM {ITEM_TABLE}) + ROW_NUMBER() OVER (ORDER BY s."Código"),
+               s."Código", s."Descrição",
+               LEFT(CAST(s."Código" AS VARCHAR), 1),
+               LEFT(CAST(s."Código" AS VARCHAR), 2),
+               LEFT(CAST(s."Código" AS VARCHAR), 4)
+        FROM _stage_itens s
+        ANTI JOIN {ITEM_TABLE} i ON i.codigo = s."Código"
+        WHERE s.com_valor
+    """)
+    (renomeados,) = con.execute(f"""
+        UPDATE {ITEM_TABLE} SET descricao = s."Descrição"
+        FROM _stage_itens s
+        WHERE {ITEM_TABLE}.codigo = s."Código"
+          AND s."Descrição" IS NOT NULL
+          AND {ITEM_TABLE}.descricao IS DISTINCT FROM s."Descrição"
+    """).fetchone()
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _stage_fato AS
+        SELECT u.uf_id, i.item_id, s.ref_month, s.quantidade,
+               f.uf_id IS NULL AS nova,
+               f.quantidade IS DISTINCT FROM s.quantidade AS alterada
+        FROM _stage_cotacoes s
+        JOIN {UF_TABLE} u ON u.uf = s."UF"
+        JOIN {ITEM_TABLE} i ON i.codigo = s."Código"
+        LEFT JOIN {FACT_TABLE} f
+          ON f.uf_id = u.uf_id AND f.item_id = i.item_id AND f.ref_month = s.ref_month
+        WHERE s.quantidade IS NOT NULL OR f.uf_id IS NOT NULL
+    """)
+
+    inseridas, atualizadas, inalteradas, removidas = con.execute("""
+        SELECT
+            COUNT(*) FILTER (WHERE nova),
+            COUNT(*) FILTER (WHERE NOT nova AND alterada AND quantidade IS NOT NULL),
+            COUNT(*) FILTER (WHERE NOT nova AND NOT alterada),
+            COUNT(*) FILTER (WHERE NOT nova AND quantidade IS NULL)
+        FROM _stage_fato
+    """).fetchone()
+
+    con.execute(f"""
+        DELETE FROM {FACT_TABLE} f
+        USING _stage_fato s
+        WHERE s.quantidade IS NULL AND NOT s.nova
+          AND f.uf_id = s.uf_id AND f.item_id = s.item_id AND f.ref_month = s.ref_month
+    """)
+    con.execute(f"""
+        INSERT INTO {FACT_TABLE}
+        SELECT uf_id, item_id, ref_month, quantidade
+        FROM _stage_fato
+        WHERE alterada AND quantidade IS NOT NULL
+        ORDER BY ref_month, uf_id, item_id
+        ON CONFLICT (uf_id, item_id, ref_month) DO UPDATE SET quantidade = EXCLUDED.quantidade
+    """)
+    meses = [m for (m,) in con.execute(
+        "SELECT DISTINCT ref_month FROM _stage_fato WHERE alterada OR quantidade IS NULL ORDER BY ref_month"
+    ).fetchall()]
+    for tabela in ("_stage_fato", "_stage_itens", "_stage_cotacoes", "_stage_raw"):
+        con.execute(f"DROP TABLE {tabela}")
+
+    return {
+        "inseridas": inseridas, "atualizadas": atualizadas, "inalteradas": inalteradas,
+        "removidas": removidas, "renomeados": renomeados, "meses": meses,
+    }
+
+
+def migrate_wide_table(con, table_name="controle_cotacoes"):
+    """
+    Recria o esquema normalizado a partir da tabela larga legada (uma coluna por mês).
+    Os cabeçalhos 'mm/aaaa' são convertidos em datas uma única vez; células vazias
+    não geram linhas e linhas duplicadas de (UF, Código, Descrição) são somadas.
+    """
+    date_cols = get_wide_date_columns(con, table_name)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for tabela in (FACT_TABLE, ITEM_TABLE, UF_TABLE):
+            con.execute(f"DROP TABLE IF EXISTS {tabela}")
+        upsert_cotacoes(con, table_name, date_cols)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+def ensure_normalized_schema(con, table_name="controle_cotacoes"):
+    """Migra a tabela larga legada para o esquema normalizado caso este ainda não exista."""
+    if not table_exists(con, FACT_TABLE) and table_exists(con, table_name):
+        migrate_wide_table(con, table_name)
+        refresh_item_flags(con)
+        bump_data_generation(con)
+    elif not table_exists(con, FACT_TABLE):
+        create_normalized_schema(con)
+
+
+def ensure_item_key(con) -> bool:
+    """
+    Converte bancos criados com dim_item único por (Código, Descrição) para a chave só por
+    Código. Um código que ganhou outro item ao mudar de descrição fica com o item mais
+    recente (maior item_id, com a descrição nova); as cotações dele prevalecem sobre as
+    cópias do item antigo no mesmo (UF, mês). Retorna True se havia itens a unificar.
+    """
+    if not table_exists(con, ITEM_TABLE):
+        return False
+    (chave_por_codigo,) = con.execute("""
+        SELECT COUNT(*) FROM duckdb_constraints()
+        WHERE table_name = ? AND constraint_type = 'UNIQUE' AND constraint_column_names = ['codigo']
+    """, [ITEM_TABLE]).fetchone()
+    if chave_por_codigo:
+        return False
+
+    (duplicados,) = con.execute(
+        f"SELECT COUNT(*) - COUNT(DISTINCT codigo) FROM {ITEM_TABLE}"
+    ).fetchone()
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE _item_map AS
+            SELECT item_id, MAX(item_id) OVER (PARTITION BY codigo) AS novo FROM {ITEM_TABLE}
+        """)
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE _dim_item AS
+            SELECT * FROM {ITEM_TABLE} WHERE item_id IN (SELECT novo FROM _item_map)
+        """)
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE _fato AS
+            SELECT f.uf_id, m.novo AS item_id, f.ref_month, arg_max(f.quantidade, f.item_id) AS quantidade
+            FROM {FACT_TABLE} f
+            JOIN _item_map m ON m.item_id = f.item_id
+            GROUP BY f.uf_id, m.novo, f.ref_month
+        """)
+        con.execute(f"DROP TABLE {FACT_TABLE}")
+        con.execute(f"DROP TABLE {ITEM_TABLE}")
+        create_normalized_schema(con)
+        con.execute(f"INSERT INTO {ITEM_TABLE} SELECT * FROM _dim_item ORDER BY item_id")
+        con.execute(f"INSERT INTO {FACT_TABLE} SELECT * FROM _fato ORDER BY ref_month, uf_id, item_id")
+        for tabela in ("_item_map", "_dim_item", "_fato"):
+            con.execute(f"DROP TABLE {tabela}")
+        if duplicados:
+            refresh_item_flags(con)
+            refresh_summaries(con)
+            bump_data_generation(con)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return duplicados > 0
+
+
+def prepare_database(con, table_name="controle_cotacoes") -> bool:
+    """
+    Deixa o banco pronto para leitura: esquema normalizado (migrando a tabela legada),
+    flags por item, ingest_log e geração dos dados. Depois disso as consultas das telas
+    não precisam criar nada e podem rodar em conexões só de leitura.
+    Retorna True se os resumos foram recalculados por inteiro (banco novo ou itens unificados).
+    """
+    ensure_normalized_schema(con, table_name)
+    create_data_generation(con)
+    recalculados = ensure_item_key(con)
+    if not table_exists(con, ITEM_FLAGS_TABLE):
+        refresh_item_flags(con)
+    create_ingest_log(con)
+    if not table_exists(con, STATUS_SUMMARY_TABLE):
+        refresh_summaries(con)
+        recalculados = True
+    elif not table_exists(con, DELTA_TABLE):
+        create_summary_tables(con)
+        refresh_deltas(con)
+    ensure_typed_weights(con)
+    return recalculados
+
+
+def get_date_columns(con) -> list:
+    """Retorna os rótulos 'mm/aaaa' dos meses presentes na tabela fato, em ordem cronológica."""
+    meses = con.execute(
+        f"SELECT DISTINCT ref_month FROM {FACT_TABLE} ORDER BY ref_month"
+    ).fetchdf()["ref_month"]
+    return pd.to_datetime(meses).dt.strftime("%m/%Y").tolist()
+
+
+def _month_filter_sql(date_cols, alias="f") -> str:
+    if date_cols is None:
+        return "TRUE"
+    datas = [month_label_to_date(c) for c in date_cols]
+    valores = ", ".join(f"DATE '{d.isoformat()}'" for d in datas if d is not None)
+    return f"{alias}.ref_month IN ({valores})" if valores else "FALSE"
+
+
+def read_series_dimensions(con, include_br=True) -> dict:
+    """
+    Dimensões usadas nas opções da aba de séries (as séries em si vêm de query_series):
+      - ufs: pd.Index dos rótulos das UFs (com 'BR' por último, se include_br).
+      - itens: DataFrame na ordem dos itens (Código, Descrição, CodigoDescricao,
+        Grupo, Exceção, Serviço).
+    """
+    if not table_exists(con, ITEM_FLAGS_TABLE):
+        refresh_item_flags(con)
+
+    ufs = con.execute(f"SELECT uf FROM {UF_TABLE} ORDER BY uf_id").fetchdf()["uf"].tolist()
+    itens = con.execute(f"""
+        SELECT i.codigo AS "Código", i.descricao AS "Descrição",
+               CAST(i.codigo AS VARCHAR) || ' - ' || i.descricao AS "CodigoDescricao",
+               LEFT(CAST(i.codigo AS VARCHAR), 4) AS "Grupo",
+               COALESCE(fl."Exceção", FALSE) AS "Exceção",
+               COALESCE(fl."Serviço", FALSE) AS "Serviço"
+        FROM {ITEM_TABLE} i
+        LEFT JOIN {ITEM_FLAGS_TABLE} fl ON fl.item_id = i.item_id
+        ORDER BY i.item_id
+    """).fetchdf()
+
+    return {
+        "ufs": pd.Index(ufs + (["BR"] if include_br else []), name="UF"),
+        "itens": itens,
+    }
+
+
+def query_series(con, ufs, grupos=None, itens=None) -> pd.DataFrame:
+    """
+    Séries históricas só das UFs, grupos e itens (rótulos CodigoDescricao) pedidos, com os
+    filtros aplicados no banco: retorna (Data_dt, UF, CodigoDescricao, Valor).
+    'BR' em ufs traz a soma das UFs, calculada apenas para os itens selecionados.
+    """
+    ufs = [str(uf) for uf in ufs]
+    condicoes_item = []
+    params_item = []
+    if grupos:
+        condicoes_item.append("list_contains(?, LEFT(CAST(codigo AS VARCHAR), 4))")
+        params_item.append([str(g) for g in grupos])
+    if itens:
+        condicoes_item.append("list_contains(?, CAST(codigo AS VARCHAR) || ' - ' || descricao)")
+        params_item.append([str(i) for i in itens])
+    filtro_item = " AND ".join(condicoes_item) or "TRUE"
+
+    partes = [f"""
+        SELECT f.ref_month, u.uf AS "UF", f.item_id, f.quantidade
+        FROM {FACT_TABLE} f
+        JOIN {UF_TABLE} u ON u.uf_id = f.uf_id
+        JOIN it ON it.item_id = f.item_id
+        WHERE list_contains(?, u.uf)
+    """]
+    params = params_item + [ufs]
+    if "BR" in ufs:
+        partes.append(f"""
+        SELECT f.ref_month, 'BR' AS "UF", f.item_id, SUM(f.quantidade)
+        FROM {FACT_TABLE} f
+        JOIN it ON it.item_id = f.item_id
+        GROUP BY f.ref_month, f.item_id
+        """)
+
+    return con.execute(f"""
+        WITH it AS (SELECT item_id FROM {ITEM_TABLE} WHERE {filtro_item})
+        SELECT CAST(s.ref_month AS TIMESTAMP) AS "Data_dt", s."UF",
+               CAST(i.codigo AS VARCHAR) || ' - ' || i.descricao AS "CodigoDescricao",
+               CAST(s.quantidade AS DOUBLE) AS "Valor"
+        FROM ({" UNION ALL ".join(partes)}) s
+        JOIN {ITEM_TABLE} i ON i.item_id = s.item_id
+        ORDER BY 1, 2, 3
+    """, params).fetchdf()
+
+
+def nivel_criticidade_sql(coluna: str) -> str:
+    """Nível de criticidade em SQL, com os mesmos limites de utils.classify_criticidade."""
+    limites = [int(b) for b in CRITICIDADE_BINS]
+    casos = " ".join(f"WHEN {coluna} <= {b} THEN {4 - i}" for i, b in enumerate(limites))
+    return f"CASE WHEN {coluna} IS NULL THEN -1 {casos} ELSE 1 END"
+
+
+def create_summary_tables(con):
+    """
+    Cria (se necessário) os resumos materializados, atualizados a cada carga:
+      - resumo_item_mes: total BR (soma das UFs) por item e mês.
+      - resumo_mensal: total BR por mês.
+      - resumo_status: contagem de itens por criticidade, por UF (incluindo BR) e mês.
+      - resumo_ultimo_mes: quantidades por UF e item no mês mais recente.
+      - resumo_variacoes: variação de cada item, por UF (incluindo BR) e mês, em relação
+        ao mês anterior e ao mesmo mês do ano anterior.
+    """
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ITEM_MONTH_SUMMARY_TABLE} (
+            item_id INTEGER NOT NULL,
+            ref_month DATE NOT NULL,
+            total BIGINT NOT NULL,
+            PRIMARY KEY (item_id, ref_month)
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MONTH_SUMMARY_TABLE} (
+            ref_month DATE PRIMARY KEY,
+            total BIGINT NOT NULL
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATUS_SUMMARY_TABLE} (
+            uf VARCHAR NOT NULL,
+            ref_month DATE NOT NULL,
+            total BIGINT NOT NULL,
+            supercritico BIGINT NOT NULL,
+            critico BIGINT NOT NULL,
+            aceitavel BIGINT NOT NULL,
+            suficiente BIGINT NOT NULL,
+            excecao BIGINT NOT NULL,
+            servicos BIGINT NOT NULL,
+            PRIMARY KEY (uf, ref_month)
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LATEST_MONTH_TABLE} (
+            uf_id SMALLINT NOT NULL,
+            "UF" VARCHAR NOT NULL,
+            "Código" BIGINT,
+            "Descrição" VARCHAR,
+            ref_month DATE NOT NULL,
+            quantidade INTEGER
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DELTA_TABLE} (
+            uf VARCHAR NOT NULL,
+            item_id INTEGER NOT NULL,
+            ref_month DATE NOT NULL,
+            quantidade BIGINT NOT NULL,
+            qtd_mes_anterior BIGINT,
+            dif_mes BIGINT,
+            pct_mes DOUBLE,
+            qtd_ano_anterior BIGINT,
+            dif_ano BIGINT,
+            pct_ano DOUBLE
+        )
+    """)
+
+
+def refresh_summaries(con, meses=None):
+    """
+    Recalcula os resumos materializados apenas para os meses informados (datas);
+    meses=None recalcula tudo (ex.: após mudar as flags de exceção/serviço).
+    O resumo do último mês só é refeito se esse mês foi alterado ou mudou.
+    Não abre transação: deve rodar na mesma transação da carga.
+    """
+    create_summary_tables(con)
+    if meses is not None and not meses:
+        return
+    rotulos = None if meses is None else [m.strftime("%m/%Y") for m in meses]
+    filtro = _month_filter_sql(rotulos, alias="f")
+    if not table_exists(con, ITEM_FLAGS_TABLE):
+        refresh_item_flags(con)
+
+    for tabela in (ITEM_MONTH_SUMMARY_TABLE, MONTH_SUMMARY_TABLE, STATUS_SUMMARY_TABLE):
+        con.execute(f"DELETE FROM {tabela} f WHERE {filtro}")
+
+    con.execute(f"""
+        INSERT INTO {ITEM_MONTH_SUMMARY_TABLE}
+        SELECT f.item_id, f.ref_month, SUM(f.quantidade)
+        FROM {FACT_TABLE} f
+        WHERE {filtro}
+        GROUP BY f.item_id, f.ref_month
+    """)
+    con.execute(f"""
+        INSERT INTO {MONTH_SUMMARY_TABLE}
+        SELECT f.ref_month, SUM(f.total)
+        FROM {ITEM_MONTH_SUMMARY_TABLE} f
+        WHERE {filtro}
+        GROUP BY f.ref_month
+    """)
+    nivel = nivel_criticidade_sql("b.quantidade")
+    con.execute(f"""
+        INSERT INTO {STATUS_SUMMARY_TABLE}
+        SELECT
+            b.uf, b.ref_month,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE NOT b.flag AND {nivel} = 4),
+            COUNT(*) FILTER (WHERE NOT b.flag AND {nivel} = 3),
+            COUNT(*) FILTER (WHERE NOT b.flag AND {nivel} = 2),
+            COUNT(*) FILTER (WHERE NOT b.flag AND {nivel} = 1),
+            COUNT(*) FILTER (WHERE b.excecao),
+            COUNT(*) FILTER (WHERE b.servico)
+        FROM (
+            SELECT v.*,
+                   COALESCE(fl."Exceção", FALSE) AS excecao,
+                   COALESCE(fl."Serviço", FALSE) AS servico,
+                   COALESCE(fl."Exceção", FALSE) OR COALESCE(fl."Serviço", FALSE) AS flag
+            FROM (
+                SELECT u.uf, f.item_id, f.ref_month, f.quantidade
+                FROM {FACT_TABLE} f
+                JOIN {UF_TABLE} u ON u.uf_id = f.uf_id
+                WHERE {filtro}
+                UNION ALL
+                SELECT 'BR', f.item_id, f.ref_month, f.total
+                FROM {ITEM_MONTH_SUMMARY_TABLE} f
+                WHERE {filtro}
+            ) v
+            LEFT JOIN {ITEM_FLAGS_TABLE} fl ON fl.item_id = v.item_id
+        ) b
+        GROUP BY b.uf, b.ref_month
+    """)
+
+    ultimo = con.execute(f"SELECT MAX(ref_month) FROM {FACT_TABLE}").fetchone()[0]
+    materializado = con.execute(f"SELECT MAX(ref_month) FROM {LATEST_MONTH_TABLE}").fetchone()[0]
+    if meses is None or ultimo != materializado or ultimo in meses:
+        con.execute(f"DELETE FROM {LATEST_MONTH_TABLE}")
+        con.execute(f"""
+            INSERT INTO {LATEST_MONTH_TABLE}
+            SELECT f.uf_id, u.uf, i.codigo, i.descricao, f.ref_month, f.quantidade
+            FROM {FACT_TABLE} f
+            JOIN {UF_TABLE} u ON u.uf_id = f.uf_id
+            JOIN {ITEM_TABLE} i ON i.item_id = f.item_id
+            WHERE f.ref_month = (SELECT MAX(ref_month) FROM {FACT_TABLE})
+        """)
+
+    refresh_deltas(con, meses)
+
+
+def _month_number(data) -> int:
+    """Número sequencial do mês (ano * 12 + mês), o mesmo usado nas janelas em SQL."""
+    return data.year * 12 + data.month
+
+
+def refresh_deltas(con, meses=None):
+    """
+    Recalcula a tabela de variações dos meses afetados pelos meses informados (datas): eles
+    mesmos e os meses seguinte e 12 meses depois, cujas bases mensal e anual mudaram;
+    meses=None recalcula tudo. A variação mensal compara com o mesmo item no mês de número
+    1 abaixo (há meses sem cotação); a anual, no de número 12 abaixo. Percentuais ficam
+    nulos quando a base é zero. As linhas de cada recálculo são gravadas em ordem de mês,
+    o que permite ao DuckDB pular blocos de outros meses nas consultas por mês
+    (ver read_top_changes).
+    Depende de resumo_item_mes (linhas BR); não abre transação.
+    """
+    if meses is None:
+        filtro_alvo, filtro_base, params = "TRUE", "TRUE", []
+        con.execute(f"DELETE FROM {DELTA_TABLE}")
+    else:
+        alvos = sorted({_month_number(m) + k for m in meses for k in (0, 1, 12)})
+        if not alvos:
+            return
+        bases = sorted({n - k for n in alvos for k in (0, 1, 12)})
+        filtro_alvo, filtro_base = "list_contains(?, d.n)", "list_contains(?, v.n)"
+        params = [bases, alvos]
+        con.execute(f"""
+            DELETE FROM {DELTA_TABLE}
+            WHERE list_contains(?, year(ref_month) * 12 + month(ref_month))
+        """, [alvos])
+    con.execute(f"""
+        INSERT INTO {DELTA_TABLE}
+        WITH v AS (
+            SELECT * FROM (
+                SELECT u.uf, f.item_id, f.ref_month, f.quantidade,
+                       year(f.ref_month) * 12 + month(f.ref_month) AS n
+                FROM {FACT_TABLE} f
+                JOIN {UF_TABLE} u ON u.uf_id = f.uf_id
+                WHERE f.quantidade IS NOT NULL
+                UNION ALL
+                SELECT 'BR', r.item_id, r.ref_month, r.total, year(r.ref_month) * 12 + month(r.ref_month)
+                FROM {ITEM_MONTH_SUMMARY_TABLE} r
+            ) v
+            WHERE {filtro_base}
+        ),
+        d AS (
+            SELECT v.uf, v.item_id, v.ref_month, v.n, v.quantidade,
+                   p.quantidade AS qtd_mes_anterior, a.quantidade AS qtd_ano_anterior
+            FROM v
+            LEFT JOIN v p ON p.uf = v.uf AND p.item_id = v.item_id AND p.n = v.n - 1
+            LEFT JOIN v a ON a.uf = v.uf AND a.item_id = v.item_id AND a.n = v.n - 12
+        )
+        SELECT uf, item_id, ref_month, quantidade,
+               qtd_mes_anterior,
+               quantidade - qtd_mes_anterior,
+               100.0 * (quantidade - qtd_mes_anterior) / NULLIF(qtd_mes_anterior, 0),
+               qtd_ano_anterior,
+               quantidade - qtd_ano_anterior,
+               100.0 * (quantidade - qtd_ano_anterior) / NULLIF(qtd_ano_anterior, 0)
+        FROM d
+        WHERE {filtro_alvo}
+        ORDER BY ref_month, uf, item_id
+    """, params)
+
+
+def read_status_summary(con) -> pd.DataFrame:
+    """Retorna a contagem por criticidade de cada UF (incluindo BR) e mês, ordenada por mês e UF."""
+    return con.execute(f"""
+        SELECT uf AS "UF",
+               strftime(ref_month, '%m/%Y') AS "Data",
+               CAST(ref_month AS TIMESTAMP) AS "Data_dt",
+               total AS "Total",
+               supercritico AS "SuperCrítico",
+               critico AS "Crítico",
+               aceitavel AS "Aceitável",
+               suficiente AS "Suficiente",
+               excecao AS "Exceção",
+               servicos AS "Serviços"
+        FROM {STATUS_SUMMARY_TABLE}
+        ORDER BY ref_month, uf
+    """).fetchdf()
+
+
+def read_monthly_totals(con) -> pd.DataFrame:
+    """Retorna o total BR de cotações de cada mês (Data, Data_dt, Total)."""
+    return con.execute(f"""
+        SELECT strftime(ref_month, '%m/%Y') AS "Data",
+               CAST(ref_month AS TIMESTAMP) AS "Data_dt",
+               CAST(total AS DOUBLE) AS "Total"
+        FROM {MONTH_SUMMARY_TABLE}
+        ORDER BY ref_month
+    """).fetchdf()
+
+
+def read_item_comparison(con, data_atual: str, data_anterior: str, uf: str = "BR") -> pd.DataFrame:
+    """
+    Retorna, para cada item com cotações na UF (BR = soma das UFs), o total nos meses atual
+    e anterior (CodigoDescricao, Qtd_Atual, Qtd_Anterior); meses sem cotação ficam nulos.
+    Qualquer par de meses pode ser comparado (lido de resumo_variacoes).
+    """
+    return con.execute(f"""
+        SELECT CAST(i.codigo AS VARCHAR) || ' - ' || i.descricao AS "CodigoDescricao",
+               CAST(SUM(r.quantidade) FILTER (WHERE r.ref_month = ?) AS DOUBLE) AS "Qtd_Atual",
+               CAST(SUM(r.quantidade) FILTER (WHERE r.ref_month = ?) AS DOUBLE) AS "Qtd_Anterior"
+        FROM {DELTA_TABLE} r
+        JOIN {ITEM_TABLE} i ON i.item_id = r.item_id
+        WHERE r.uf = ?
+        GROUP BY 1
+        ORDER BY 1
+    """, [month_label_to_date(data_atual), month_label_to_date(data_anterior), uf]).fetchdf()
+
+
+def read_top_changes(con, data: str, base: str = "mes", uf: str = "BR", k: int = 20, quedas: bool = True) -> pd.DataFrame:
+    """
+    As k maiores quedas (ou altas, com quedas=False) de quantidade no mês 'mm/aaaa', por item,
+    na UF (BR = soma das UFs), contra o mês anterior (base='mes') ou o mesmo mês do ano
+    anterior (base='ano'). Lido das variações já materializadas: um filtro por mês e um top-k.
+    """
+    if base not in ("mes", "ano"):
+        raise ValueError(f"Base de comparação desconhecida: {base}")
+    sufixo = base
+    ordem = "ASC" if quedas else "DESC"
+    return con.execute(f"""
+        SELECT r.uf AS "UF",
+               CAST(i.codigo AS VARCHAR) || ' - ' || i.descricao AS "CodigoDescricao",
+               CAST(r.quantidade AS DOUBLE) AS "Quantidade",
+               CAST(r.qtd_{sufixo}_anterior AS DOUBLE) AS "Anterior",
+               CAST(r.dif_{sufixo} AS DOUBLE) AS "Diferença",
+               r.pct_{sufixo} AS "Diferença (%)"
+        FROM {DELTA_TABLE} r
+        JOIN {ITEM_TABLE} i ON i.item_id = r.item_id
+        WHERE r.ref_month = ? AND r.uf = ? AND r.dif_{sufixo} IS NOT NULL
+        ORDER BY r.dif_{sufixo} {ordem}, r.quantidade {ordem}, 2
+        LIMIT ?
+    """, [month_label_to_date(data), uf, int(k)]).fetchdf()
+
+
+def read_latest_month(con, detalhes: bool = False) -> pd.DataFrame:
+    """
+    Retorna o resumo do mês mais recente na forma larga, com a coluna do mês
+    (UF, Código, Descrição, 'mm/aaaa'), sem a agregação BR.
+    Com detalhes, traz também as colunas CodigoDescricao, Grupo, Exceção e Serviço.
+    """
+    ultimo = con.execute(f"SELECT MAX(ref_month) FROM {LATEST_MONTH_TABLE}").fetchone()[0]
+    if ultimo is None:
+        return pd.DataFrame(columns=ID_COLUMNS)
+    rotulo = ultimo.strftime('%m/%Y')
+    colunas_extras = ', "Exceção", "Serviço", "CodigoDescricao", "Grupo"' if detalhes else ""
+    return con.execute(f"""
+        SELECT "UF", "Código", "Descrição", "{rotulo}"{colunas_extras}
+        FROM (
+            SELECT l.uf_id, UPPER(TRIM(l."UF")) AS "UF", l."Código", l."Descrição", l.quantidade AS "{rotulo}",
+                   CAST(l."Código" AS VARCHAR) || ' - ' || l."Descrição" AS "CodigoDescricao",
+                   LEFT(CAST(l."Código" AS VARCHAR), 4) AS "Grupo",
+                   COALESCE(fl."Exceção", FALSE) AS "Exceção",
+                   COALESCE(fl."Serviço", FALSE) AS "Serviço"
+            FROM {LATEST_MONTH_TABLE} l
+            LEFT JOIN {ITEM_FLAGS_TABLE} fl
+              ON fl."Código" = l."Código" AND fl."Descrição" IS NOT DISTINCT FROM l."Descrição"
+        )
+        ORDER BY uf_id, "Código", "Descrição"
+    """).fetchdf()
+
+
+def query_coverage(con) -> pd.DataFrame:
+    """
+    Cobertura do mês mais recente para todas as UFs de uma vez: junta as quantidades
+    (resumo_ultimo_mes) com as ponderações do mesmo mês pelo código inteiro do item e
+    calcula, por item x UF, o nível e o rótulo de criticidade (0 = Exceção), a prioridade
+    pela ponderação e a falta para a cobertura mínima. Apenas itens presentes nas duas bases.
+    """
+    ultimo = con.execute(f"SELECT MAX(ref_month) FROM {LATEST_MONTH_TABLE}").fetchone()[0]
+    if ultimo is None or not table_exists(con, WEIGHT_TABLE):
+        return pd.DataFrame(columns=[
+            "UF", "Código", "CodigoDescricao", "Grupo", "Quantidade", "Ponderação", "Exceção",
+            "Serviço", "CriticidadeNivel", "Criticidade", "Prioridade", "Falta p/ Cobertura Mínima",
+        ])
+
+    rotulo = ultimo.strftime('%m/%Y')
+    colunas_peso = [c[0] for c in con.execute(f"DESCRIBE {WEIGHT_TABLE}").fetchall()]
+    peso_sql = f"CAST(w.{quote_identifier(rotulo)} AS DOUBLE)" if rotulo in colunas_peso else "CAST(NULL AS DOUBLE)"
+
+    rotulos_sql = " ".join(
+        f"WHEN {nivel} THEN '{rotulo_nivel}'"
+        for nivel, rotulo_nivel in enumerate(CRITICIDADE_ROTULOS[1:])
+    )
+    prioridade_sql = " ".join(f"WHEN peso > {limite} THEN '{nome}'" for limite, nome in PRIORIDADE_LIMITES)
+    return con.execute(f"""
+        SELECT "UF", "Código", "CodigoDescricao", "Grupo", "Quantidade", peso AS "Ponderação",
+               "Exceção", "Serviço", nivel AS "CriticidadeNivel",
+               CASE nivel {rotulos_sql} END AS "Criticidade",
+               CASE {prioridade_sql} ELSE '{PRIORIDADE_PADRAO}' END AS "Prioridade",
+               GREATEST(0, {COBERTURA_MINIMA} - "Quantidade") AS "Falta p/ Cobertura Mínima"
+        FROM (
+            SELECT l.uf_id, l."UF", l."Código",
+                   CAST(l."Código" AS VARCHAR) || ' - ' || l."Descrição" AS "CodigoDescricao",
+                   LEFT(CAST(l."Código" AS VARCHAR), 4) AS "Grupo",
+                   l.quantidade AS "Quantidade",
+                   {peso_sql} AS peso,
+                   COALESCE(fl."Exceção", FALSE) AS "Exceção",
+                   COALESCE(fl."Serviço", FALSE) AS "Serviço",
+                   CASE WHEN COALESCE(fl."Exceção", FALSE) THEN 0
+                        ELSE {nivel_criticidade_sql("l.quantidade")} END AS nivel
+            FROM {LATEST_MONTH_TABLE} l
+            JOIN {WEIGHT_TABLE} w
+              ON w."UF" = l."UF" AND TRY_CAST(w."Cód.Estrutura" AS BIGINT) = l."Código"
+            LEFT JOIN {ITEM_FLAGS_TABLE} fl
+              ON fl."Código" = l."Código" AND fl."Descrição" IS NOT DISTINCT FROM l."Descrição"
+        )
+        ORDER BY uf_id, "CodigoDescricao"
+    """).fetchdf()
+
+
+def _typed_weights_sql(con, source: str) -> str:
+    """
+    SELECT que converte a base de ponderações lida da planilha (texto, formato brasileiro)
+    na tabela tipada: apenas subitens (Cód.Estrutura com 6+ dígitos), CodigoDescricao,
+    UF normalizada, meses em DOUBLE e as chaves de grupo (Cód_Estrutura_4 e Grupo).
+    """
+    colunas = con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+    uf_sql = " ".join(
+        f"WHEN '{capital}' THEN '{uf}'" for capital, uf in CAPITAL_TO_UF.items()
+    )
+    selecao = []
+    for nome, tipo, *_ in colunas:
+        col = quote_identifier(nome)
+        if nome == "UF":
+            selecao.append('"CodigoDescricao"')
+            selecao.append(f'COALESCE(CASE "UF" {uf_sql} END, "UF") AS "UF"')
+        elif re.match(r'\d{2}/\d{4}', nome):
+            if tipo in ("VARCHAR", "STRING"):
+                selecao.append(
+                    f"TRY_CAST(REPLACE(REPLACE({col}, '.', ''), ',', '.') AS DOUBLE) AS {col}"
+                )
+            else:
+                selecao.append(f"TRY_CAST({col} AS DOUBLE) AS {col}")
+        else:
+            selecao.append(col)
+    return f"""
+        SELECT {", ".join(selecao)},
+               LEFT("Cód.Estrutura", 4) AS "Cód_Estrutura_4",
+               LEFT(split_part("CodigoDescricao", ' - ', 1), 4) AS "Grupo"
+        FROM (
+            SELECT *, TRIM(CAST("Cód.Estrutura" AS VARCHAR) || ' - ' || "Descrição")
+                      AS "CodigoDescricao"
+            FROM {source}
+            WHERE length("Cód.Estrutura") >= 6
+        )
+    """
+
+
+def store_weights(con, df_weight: pd.DataFrame, table_name=WEIGHT_TABLE):
+    """Grava a base de ponderações lida da planilha já tipada (ver _typed_weights_sql)."""
+    con.register("df_weight_excel", df_weight)
+    try:
+        con.execute(f"CREATE OR REPLACE TABLE {table_name} AS {_typed_weights_sql(con, 'df_weight_excel')}")
+    finally:
+        con.unregister("df_weight_excel")
+
+
+def ensure_typed_weights(con, table_name=WEIGHT_TABLE):
+    """Converte uma tabela de ponderações gravada no formato antigo (tudo texto) para a tipada."""
+    if not table_exists(con, table_name):
+        return
+    colunas = [c[0] for c in con.execute(f"DESCRIBE {table_name}").fetchall()]
+    if "Grupo" in colunas:
+        return
+    con.execute(f"CREATE OR REPLACE TABLE _ponderacoes_tipadas AS {_typed_weights_sql(con, table_name)}")
+    con.execute(f"DROP TABLE {table_name}")
+    con.execute(f"ALTER TABLE _ponderacoes_tipadas RENAME TO {table_name}")
+
+
+def file_sha256(data: bytes) -> str:
+    """Calcula o SHA-256 (hexadecimal) do conteúdo de um arquivo enviado."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def create_ingest_log(con):
+    """Cria (se necessário) a tabela que registra cada arquivo carregado em cada base."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INGEST_LOG_TABLE} (
+            base VARCHAR NOT NULL,
+            sha256 VARCHAR NOT NULL,
+            file_name VARCHAR,
+            sheets VARCHAR[],
+            linhas_lidas BIGINT,
+            inseridas BIGINT,
+            atualizadas BIGINT,
+            inalteradas BIGINT,
+            first_loaded_at TIMESTAMP NOT NULL,
+            loaded_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (base, sha256)
+        )
+    """)
+
+
+def is_current_version(con, base: str, sha256: str) -> bool:
+    """
+    Indica se o arquivo (pelo SHA-256) é o último carregado na base. Nesse caso a carga
+    pode ser ignorada; um arquivo antigo carregado de novo volta a ser aplicado.
+    """
+    if not table_exists(con, INGEST_LOG_TABLE):
+        return False
+    atual = con.execute(
+        f"SELECT sha256 FROM {INGEST_LOG_TABLE} WHERE base = ? ORDER BY loaded_at DESC LIMIT 1",
+        [base]
+    ).fetchone()
+    return atual is not None and atual[0] == sha256
+
+
+def record_ingest(con, base: str, sha256: str, file_name: str, sheets, linhas_lidas: int,
+                  contagem: dict = None):
+    """Registra (ou atualiza) no ingest_log a carga de um arquivo em uma base."""
+    create_ingest_log(con)
+    contagem = contagem or {}
+    con.execute(f"""
+        INSERT INTO {INGEST_LOG_TABLE}
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, now()::TIMESTAMP, now()::TIMESTAMP)
+        ON CONFLICT (base, sha256) DO UPDATE SET
+            file_name = EXCLUDED.file_name,
+            sheets = EXCLUDED.sheets,
+            linhas_lidas = EXCLUDED.linhas_lidas,
+            inseridas = EXCLUDED.inseridas,
+            atualizadas = EXCLUDED.atualizadas,
+            inalteradas = EXCLUDED.inalteradas,
+            loaded_at = EXCLUDED.loaded_at
+    """, [
+        base, sha256, file_name, [str(s) for s in sheets], int(linhas_lidas),
+        contagem.get("inseridas"), contagem.get("atualizadas"), contagem.get("inalteradas"),
+    ])
+    bump_data_generation(con)
+
+
+def create_data_generation(con):
+    """Cria (se necessário) a tabela de uma linha com a geração atual dos dados."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {GENERATION_TABLE} (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            geracao BIGINT NOT NULL
+        )
+    """)
+    con.execute(f"INSERT INTO {GENERATION_TABLE} VALUES (TRUE, 0) ON CONFLICT DO NOTHING")
+
+
+def get_data_generation(con) -> int:
+    """
+    Retorna a geração atual dos dados: um número que só cresce, incrementado a cada
+    carga registrada. Resultados calculados para uma geração valem enquanto ela não muda.
+    """
+    if not table_exists(con, GENERATION_TABLE):
+        return 0
+    return con.execute(f"SELECT geracao FROM {GENERATION_TABLE}").fetchone()[0]
+
+
+def bump_data_generation(con) -> int:
+    """Incrementa a geração dos dados (chamado por record_ingest) e retorna o novo valor."""
+    create_data_generation(con)
+    return con.execute(
+        f"UPDATE {GENERATION_TABLE} SET geracao = geracao + 1 RETURNING geracao"
+    ).fetchone()[0]
+
+
+def read_loaded_versions(con) -> pd.DataFrame:
+    """Retorna, para cada base, o último arquivo carregado segundo o ingest_log."""
+    if not table_exists(con, INGEST_LOG_TABLE):
+        return pd.DataFrame(columns=["base", "file_name", "sha256", "linhas_lidas", "loaded_at"])
+    return con.execute(f"""
+        SELECT base, file_name, LEFT(sha256, 12) AS sha256, linhas_lidas, loaded_at
+        FROM {INGEST_LOG_TABLE}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY base ORDER BY loaded_at DESC) = 1
+        ORDER BY base
+    """).fetchdf()
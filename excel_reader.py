@@ -0,0 +1,109 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Abaixo deste tamanho o parse em processos separados é mais lento que no processo atual:
+# cada processo (spawn) reimporta o pandas e recebe uma cópia do arquivo, o que custa
+# alguns segundos, enquanto as planilhas usuais (ponderações, exceções) levam décimos.
+MIN_BYTES_PARALELO = 32 * 1024 ** 2
+
+def default_engine() -> str:
+    """Usa o backend calamine (leitura em Rust, bem mais rápida) quando instalado; senão openpyxl."""
+    try:
+        import python_calamine  # noqa: F401
+        return "calamine"
+    except ImportError:
+        return "openpyxl"
+
+def workbook_bytes(source) -> bytes:
+    """Lê o conteúdo de um arquivo enviado (UploadedFile/BytesIO), caminho ou bytes uma única vez."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    source.seek(0)
+    return source.read()
+
+def _parse_sheets(data: bytes, sheet_names: list, engine: str, kwargs: dict) -> dict:
+    """Abre a planilha a partir dos bytes e faz o parse das abas pedidas."""
+    with pd.ExcelFile(io.BytesIO(data), engine=engine) as xls:
+        return {sheet: xls.parse(sheet, **kwargs) for sheet in sheet_names}
+
+def read_workbook_sheets(source, sheet_names=None, engine=None, max_workers=None, **kwargs) -> dict:
+    """
+    Lê várias abas de uma planilha Excel, retornando {aba: DataFrame} na ordem pedida.
+      - O arquivo é lido uma única vez; sheet_names=None lê todas as abas.
+      - Por padrão o parse é feito no processo atual. Com max_workers > 1, ou num arquivo a
+        partir de MIN_BYTES_PARALELO com mais de um núcleo, as abas são processadas em paralelo
+        em um pool de processos iniciados por spawn (cada processo faz o parse só das suas abas).
+      - kwargs são repassados ao parse de cada aba (ex.: skiprows).
+    """
+    data = workbook_bytes(source)
+    engine = engine or default_engine()
+
+    if sheet_names is None:
+        with pd.ExcelFile(io.BytesIO(data), engine=engine) as xls:
+            sheet_names = xls.sheet_names
+    sheet_names = list(sheet_names)
+
+    if max_workers is None:
+        max_workers = min(len(sheet_names), os.cpu_count() or 1) if len(data) >= MIN_BYTES_PARALELO else 1
+    max_workers = min(max_workers, len(sheet_names))
+
+    if max_workers <= 1 or len(sheet_names) <= 1:
+        return _parse_sheets(data, sheet_names, engine, kwargs)
+
+    lotes = [sheet_names[i::max_workers] for i in range(max_workers)]
+    try:
+        # spawn: o processo do Streamlit/DuckDB tem várias threads, e um fork pode herdar
+        # travas seguradas por elas e travar o processo filho
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(_parse_sheets, data, lote, engine, kwargs) for lote in lotes]
+            resultados = {}
+            for future in futures:
+                resultados.update(future.result())
+    except (OSError, RuntimeError):
+        # Ambientes sem suporte a processos filhos: faz o parse no processo atual
+        return _parse_sheets(data, sheet_names, engine, kwargs)
+
+    return {sheet: resultados[sheet] for sheet in sheet_names}
+
+def _iter_rows_openpyxl(data: bytes, sheet_names):
+    """
+    Linhas via openpyxl em modo somente leitura, que lê o XML da aba sob demanda: a memória
+    fica limitada à linha corrente, qualquer que seja o tamanho da aba. (O calamine carrega
+    o intervalo inteiro da aba antes de entregar a primeira linha.)
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for sheet in (sheet_names if sheet_names is not None else workbook.sheetnames):
+            for row in workbook[sheet].iter_rows(values_only=True):
+                yield sheet, row
+    finally:
+        workbook.close()
+
+def iter_workbook_rows(source, sheet_names=None, skiprows=0):
+    """
+    Percorre as linhas das abas pedidas, uma aba por vez, lendo o arquivo uma única vez.
+    Gera tuplas (aba, valores_da_linha) sem montar DataFrames; as primeiras skiprows
+    linhas de cada aba são puladas. Sempre usa o openpyxl em modo somente leitura, para
+    que a memória da leitura não cresça com o tamanho das abas (ver _iter_rows_openpyxl).
+    """
+    data = workbook_bytes(source)
+    linhas = _iter_rows_openpyxl(data, sheet_names)
+
+    aba_atual, posicao = None, 0
+    for sheet, row in linhas:
+        if sheet != aba_atual:
+            aba_atual, posicao = sheet, 0
+        if posicao >= skiprows:
+            yield sheet, row
+        posicao += 1
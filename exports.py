@@ -0,0 +1,73 @@
+import importlib.util
+from io import BytesIO
+
+import pandas as pd
+
+from result_cache import get_or_compute
+from utils import to_excel_conditional
+
+# Formatos de download: rótulo -> (extensão, tipo MIME)
+EXPORT_FORMATS = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def available_formats() -> list:
+    """Formatos oferecidos: Excel e CSV sempre; Parquet só com pyarrow (ou fastparquet) instalado."""
+    formatos = ["Excel", "CSV"]
+    if any(importlib.util.find_spec(m) is not None for m in ("pyarrow", "fastparquet")):
+        formatos.append("Parquet")
+    return formatos
+
+
+def export_file_name(base: str, formato: str) -> str:
+    """Nome do arquivo de download com a extensão do formato."""
+    return f"{base}.{EXPORT_FORMATS[formato][0]}"
+
+
+def export_mime(formato: str) -> str:
+    return EXPORT_FORMATS[formato][1]
+
+
+def export_bytes(df: pd.DataFrame, formato: str, sheet_name: str, value_columns=(), category_column=None) -> bytes:
+    """
+    Serializa o DataFrame no formato pedido.
+      - Excel: cores de criticidade como formatação condicional (utils.to_excel_conditional).
+      - CSV/Parquet: só os dados, bem mais rápidos para extrações grandes; a coluna de
+        categoria, que no Excel só alimenta as cores, fica de fora.
+    """
+    if formato == "Excel":
+        return to_excel_conditional(df, sheet_name, list(value_columns), category_column)
+    if category_column is not None:
+        df = df.drop(columns=category_column)
+    if formato == "CSV":
+        return df.to_csv(index=False).encode("utf-8-sig")
+    if formato == "Parquet":
+        output = BytesIO()
+        df.to_parquet(output, index=False)
+        return output.getvalue()
+    raise ValueError(f"Formato de exportação desconhecido: {formato}")
+
+
+def spec_key(filtros: dict) -> tuple:
+    """Forma hashable e estável de um dicionário de filtros {coluna: valores}."""
+    return tuple(sorted((coluna, tuple(valores or ())) for coluna, valores in filtros.items()))
+
+
+def lazy_export(db_path: str, geracao: int, chave, build, formato: str, sheet_name: str,
+                value_columns=(), category_column=None):
+    """
+    Retorna uma função sem argumentos que gera o arquivo só quando chamada (st.download_button
+    aceita essa função em data= e a executa no clique). build() monta o DataFrame a exportar.
+    Os bytes ficam no cache de resultados por (banco, geracao, chave, formato): o mesmo recorte
+    com os mesmos filtros não é serializado de novo, e uma nova carga de dados invalida tudo.
+    """
+    def gerar() -> bytes:
+        return get_or_compute(
+            geracao,
+            (db_path, "export", chave, formato),
+            lambda: export_bytes(build(), formato, sheet_name, value_columns, category_column),
+        )
+    return gerar
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from utils import classify_criticidade
+
+# Opções do filtro de criticidade que não dependem da quantidade, e sim das flags do item
+FLAG_OPTIONS = {"Exceção": "Exceção", "Serviços": "Serviço"}
+
+
+def _active(filtros: dict) -> dict:
+    """Mantém apenas os filtros com valores selecionados."""
+    return {col: list(valores) for col, valores in (filtros or {}).items() if valores}
+
+
+def criticidade_mask(df: pd.DataFrame, selected_criticidade, value_columns) -> np.ndarray:
+    """
+    Linhas que atendem ao filtro de criticidade: itens de exceção/serviço entram pelas
+    opções "Exceção"/"Serviços"; os demais quando alguma das colunas de quantidade
+    tem uma das criticidades escolhidas.
+    """
+    cols = [value_columns] if isinstance(value_columns, str) else list(value_columns)
+    flags = {
+        opcao: (df[col].to_numpy(dtype=bool) if col in df.columns else np.zeros(len(df), dtype=bool))
+        for opcao, col in FLAG_OPTIONS.items()
+    }
+    sem_flag = ~np.logical_or.reduce(list(flags.values()))
+
+    _, rotulos = classify_criticidade(df[cols])
+    mask = sem_flag & np.isin(rotulos, list(selected_criticidade)).any(axis=1)
+    for opcao, flag in flags.items():
+        if opcao in selected_criticidade:
+            mask |= flag
+    return mask
+
+
+def filter_mask(df: pd.DataFrame, filtros: dict, criticidade=None, value_columns=None):
+    """
+    Combina em uma única máscara booleana os filtros {coluna: valores} e, opcionalmente,
+    o filtro de criticidade. Retorna None quando nenhum filtro está ativo.
+    """
+    mascaras = [df[col].isin(valores).to_numpy() for col, valores in _active(filtros).items()]
+    if criticidade:
+        mascaras.append(criticidade_mask(df, criticidade, value_columns))
+    if not mascaras:
+        return None
+    return np.logical_and.reduce(mascaras)
+
+
+def apply_filters(df: pd.DataFrame, filtros: dict, criticidade=None, value_columns=None) -> pd.DataFrame:
+    """
+    Aplica os filtros com uma só seleção ao final. Sem filtros ativos, retorna o próprio
+    DataFrame (sem cópia): quem chama não deve alterá-lo no lugar.
+    """
+    mask = filter_mask(df, filtros, criticidade, value_columns)
+    return df if mask is None else df[mask]
@@ -0,0 +1,66 @@
+from collections import deque
+
+import pandas as pd
+
+
+def build_automaton(patterns) -> tuple:
+    """
+    Constrói um autômato de Aho-Corasick para um conjunto de padrões.
+    Retorna a tupla (transicoes, falhas, terminais), onde cada estado é um inteiro.
+    """
+    transicoes = [{}]
+    terminais = [False]
+
+    for padrao in patterns:
+        if not padrao:
+            continue
+        estado = 0
+        for char in padrao:
+            proximo = transicoes[estado].get(char)
+            if proximo is None:
+                proximo = len(transicoes)
+                transicoes[estado][char] = proximo
+                transicoes.append({})
+                terminais.append(False)
+            estado = proximo
+        terminais[estado] = True
+
+    falhas = [0] * len(transicoes)
+    fila = deque(transicoes[0].values())
+    while fila:
+        estado = fila.popleft()
+        for char, proximo in transicoes[estado].items():
+            fila.append(proximo)
+            falha = falhas[estado]
+            while falha and char not in transicoes[falha]:
+                falha = falhas[falha]
+            falhas[proximo] = transicoes[falha].get(char, 0)
+            terminais[proximo] = terminais[proximo] or terminais[falhas[proximo]]
+
+    return transicoes, falhas, terminais
+
+
+def contains_any(automaton: tuple, texto: str) -> bool:
+    """Indica se algum padrão do autômato ocorre como substring do texto."""
+    transicoes, falhas, terminais = automaton
+    estado = 0
+    for char in texto:
+        while estado and char not in transicoes[estado]:
+            estado = falhas[estado]
+        estado = transicoes[estado].get(char, 0)
+        if terminais[estado]:
+            return True
+    return False
+
+
+def match_flags(textos: pd.Series, patterns) -> pd.Series:
+    """
+    Marca os textos que contêm ao menos um dos padrões.
+    Cada texto é percorrido uma única vez, independentemente da quantidade de padrões.
+    """
+    patterns = [str(p) for p in pd.Series(list(patterns), dtype=object).dropna().unique()]
+    if not patterns:
+        return pd.Series(False, index=textos.index)
+
+    automaton = build_automaton(patterns)
+    return textos.astype(str).map(lambda texto: contains_any(automaton, texto)).astype(bool)
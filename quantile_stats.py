@@ -0,0 +1,127 @@
+import pandas as pd
+
+from database import (
+    FACT_TABLE, UF_TABLE, ITEM_MONTH_SUMMARY_TABLE, nivel_criticidade_sql, table_exists
+)
+
+QUANTILE_TABLE = "resumo_quantis"
+
+# Janelas (em meses) materializadas: 1 = só o mês; as demais agregam os meses anteriores
+JANELAS = (1, 3, 12)
+
+
+def create_quantile_table(con):
+    """
+    Cria (se necessário) o resumo de quantis das quantidades por UF (incluindo BR), janela e mês:
+    quantidade de observações, meses da janela com cotação, Q1, mediana, média e Q3.
+    """
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {QUANTILE_TABLE} (
+            uf VARCHAR,
+            janela SMALLINT,
+            ref_month DATE,
+            itens INTEGER,
+            meses SMALLINT,
+            q1 DOUBLE,
+            mediana DOUBLE,
+            media DOUBLE,
+            q3 DOUBLE
+        )
+    """)
+
+
+def refresh_quantile_stats(con, meses=None):
+    """
+    Recalcula o resumo de quantis numa única agregação do DuckDB, apenas para as janelas que
+    contêm os meses informados (datas): de cada mês alterado até janela - 1 meses depois;
+    meses=None recalcula todo o histórico.
+    Entram as quantidades que não são Suficientes (<= 100), como no antigo cálculo por pivot
+    de um mês (quantis contínuos, iguais aos do pandas); os itens de exceção não são
+    excluídos, pois a classificação por quantidade nunca os rotulava como "Exceção".
+    Cada quantidade é repetida para os meses de referência de cada janela que a contêm, de
+    modo que os quantis móveis (janela > 1) saem do mesmo GROUP BY que os mensais.
+    Depende de resumo_item_mes (linhas BR); não abre transação.
+    """
+    create_quantile_table(con)
+    if meses is None:
+        con.execute(f"DELETE FROM {QUANTILE_TABLE}")
+        janelas = ", ".join(f"({j})" for j in JANELAS)
+        alvos = f"SELECT j.janela, m.n FROM (VALUES {janelas}) j(janela) CROSS JOIN m"
+    else:
+        pares = sorted({(j, m.year * 12 + m.month + k) for m in meses for j in JANELAS for k in range(j)})
+        if not pares:
+            return
+        valores = ", ".join(f"({j}, {n})" for j, n in pares)
+        con.execute(f"""
+            DELETE FROM {QUANTILE_TABLE} q
+            USING (VALUES {valores}) a(janela, n)
+            WHERE q.janela = a.janela AND year(q.ref_month) * 12 + month(q.ref_month) = a.n
+        """)
+        alvos = f"SELECT * FROM (VALUES {valores}) a(janela, n)"
+    nivel = nivel_criticidade_sql("v.quantidade")
+    con.execute(f"""
+        INSERT INTO {QUANTILE_TABLE}
+        WITH v AS (
+            SELECT v.uf, v.ref_month, v.quantidade,
+                   year(v.ref_month) * 12 + month(v.ref_month) AS n
+            FROM (
+                SELECT u.uf, f.ref_month, f.quantidade
+                FROM {FACT_TABLE} f
+                JOIN {UF_TABLE} u ON u.uf_id = f.uf_id
+                UNION ALL
+                SELECT 'BR', r.ref_month, r.total
+                FROM {ITEM_MONTH_SUMMARY_TABLE} r
+            ) v
+            WHERE v.quantidade IS NOT NULL
+              AND {nivel} > 1
+        ),
+        m AS (
+            SELECT DISTINCT ref_month, year(ref_month) * 12 + month(ref_month) AS n
+            FROM {FACT_TABLE}
+        ),
+        a AS ({alvos}),
+        s AS (
+            SELECT v.uf, a.janela, m.ref_month,
+                   COUNT(*) AS itens,
+                   COUNT(DISTINCT v.n) AS meses,
+                   quantile_cont(v.quantidade, [0.25, 0.5, 0.75]) AS q,
+                   AVG(v.quantidade) AS media
+            FROM a
+            JOIN m ON m.n = a.n
+            JOIN v ON v.n BETWEEN a.n - a.janela + 1 AND a.n
+            GROUP BY v.uf, a.janela, m.ref_month
+        )
+        SELECT uf, janela, ref_month, itens, meses, q[1], q[2], media, q[3]
+        FROM s
+        ORDER BY janela, ref_month, uf
+    """)
+
+
+def ensure_quantile_stats(con):
+    """Materializa o resumo de quantis em bancos criados antes dele."""
+    if not table_exists(con, QUANTILE_TABLE):
+        refresh_quantile_stats(con)
+
+
+def read_quantile_stats(con, janela: int = 1, ufs=None) -> pd.DataFrame:
+    """
+    Quantis por UF e mês de todo o histórico para a janela pedida (ver JANELAS), com as
+    colunas UF, Data, Data_dt, Itens, Meses, Q1, Median, Mean e Q3, ordenados por mês e UF.
+    """
+    if janela not in JANELAS:
+        raise ValueError(f"Janela não materializada: {janela} (use uma de {JANELAS})")
+    params = [janela]
+    filtro_uf = ""
+    if ufs:
+        filtro_uf = "AND list_contains(?, uf)"
+        params.append([str(uf) for uf in ufs])
+    df = con.execute(f"""
+        SELECT uf AS "UF", ref_month AS "Data_dt", itens AS "Itens", meses AS "Meses",
+               q1 AS "Q1", mediana AS "Median", media AS "Mean", q3 AS "Q3"
+        FROM {QUANTILE_TABLE}
+        WHERE janela = ? {filtro_uf}
+        ORDER BY ref_month, uf
+    """, params).fetchdf()
+    df["Data_dt"] = pd.to_datetime(df["Data_dt"])
+    df.insert(1, "Data", df["Data_dt"].dt.strftime("%m/%Y"))
+    return df
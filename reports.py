@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from core import consolidated_table, national_coverage
+from exports import export_bytes, export_file_name
+
+# Nome do relatório BR: a cobertura de todas as UFs numa só planilha
+BR_REPORT = "BR"
+
+# Cobertura carregada uma vez por processo de trabalho (ver _init_worker)
+_cobertura = None
+
+# Abaixo deste número de linhas da cobertura, os relatórios são gerados no processo atual
+# por padrão: iniciar os processos (spawn) custa alguns segundos, mais que gerar todos eles
+MIN_LINHAS_PARALELO = 50_000
+
+
+def report_file_name(uf: str, formato: str) -> str:
+    """Nome do arquivo do relatório de uma UF (ou do BR) no formato pedido."""
+    base = "cobertura_todas_ufs" if uf == BR_REPORT else f"tabela_consolidada_{uf}"
+    return export_file_name(base, formato)
+
+
+def _render_report(df_cobertura: pd.DataFrame, uf: str, pasta: str, formato: str) -> str:
+    """Gera e grava o relatório de uma UF (tabela consolidada) ou o BR (cobertura de todas as UFs)."""
+    if uf == BR_REPORT:
+        df, sheet_name, value_columns = national_coverage(df_cobertura), "Cobertura_UFs", ["Quantidade"]
+    else:
+        df_display, categoria = consolidated_table(df_cobertura, uf)
+        df, sheet_name, value_columns = df_display.assign(Categoria=categoria), "Tabela_Consolidada", [f"{uf}_qtd"]
+
+    caminho = os.path.join(pasta, report_file_name(uf, formato))
+    with open(caminho, "wb") as f:
+        f.write(export_bytes(df, formato, sheet_name, value_columns, "Categoria"))
+    return caminho
+
+
+def _write_arrow(df: pd.DataFrame, caminho: str):
+    import pyarrow as pa
+
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(caminho, "wb") as sink, pa.ipc.new_file(sink, tabela.schema) as writer:
+        writer.write_table(tabela)
+
+
+def _init_worker(caminho_arrow: str):
+    """Abre a cobertura do arquivo Arrow IPC por memory map, uma vez por processo de trabalho."""
+    import pyarrow as pa
+
+    global _cobertura
+    with pa.memory_map(caminho_arrow) as source:
+        _cobertura = pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def _render_in_worker(uf: str, pasta: str, formato: str) -> str:
+    return _render_report(_cobertura, uf, pasta, formato)
+
+
+def render_uf_reports(df_cobertura: pd.DataFrame, ufs, pasta: str, formato: str = "Excel",
+                      incluir_br: bool = True, max_workers=None) -> dict:
+    """
+    Gera os relatórios de cobertura de cada UF (e o BR, com todas as UFs) a partir da
+    cobertura já calculada (core.load_app_data).
+      - Por padrão os relatórios são gerados no processo atual; o pool de processos é usado com
+        max_workers > 1 ou, com mais de um núcleo, a partir de MIN_LINHAS_PARALELO linhas.
+      - No pool, a cobertura é gravada uma vez num arquivo Arrow IPC temporário e cada processo
+        (iniciado por spawn) a abre por memory map na inicialização, em vez de recebê-la
+        serializada por tarefa.
+      - Sem pyarrow, os relatórios são sempre gerados no processo atual.
+    Retorna {"arquivos": [caminhos na ordem das UFs], "segundos": tempo total, "processos": n}.
+    """
+    inicio = time.perf_counter()
+    relatorios = list(ufs) + ([BR_REPORT] if incluir_br else [])
+    os.makedirs(pasta, exist_ok=True)
+
+    if max_workers is None:
+        max_workers = min(len(relatorios), os.cpu_count() or 1) if len(df_cobertura) >= MIN_LINHAS_PARALELO else 1
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        max_workers = 1
+
+    def sequencial():
+        return [_render_report(df_cobertura, uf, pasta, formato) for uf in relatorios]
+
+    if max_workers <= 1 or len(relatorios) <= 1:
+        arquivos, max_workers = sequencial(), 1
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho_arrow = os.path.join(tmp, "cobertura.arrow")
+            _write_arrow(df_cobertura, caminho_arrow)
+            try:
+                # spawn, como em excel_reader.read_workbook_sheets: fork a partir de um processo
+                # com várias threads (Streamlit/DuckDB) pode travar os processos filhos
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                         initargs=(caminho_arrow,),
+                                         mp_context=multiprocessing.get_context("spawn")) as executor:
+                    futures = [executor.submit(_render_in_worker, uf, pasta, formato) for uf in relatorios]
+                    arquivos = [future.result() for future in futures]
+            except (OSError, RuntimeError):
+                # Ambientes sem suporte a processos filhos: gera no processo atual
+                arquivos, max_workers = sequencial(), 1
+
+    return {"arquivos": arquivos, "segundos": time.perf_counter() - inicio, "processos": max_workers}
@@ -0,0 +1,82 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Limite de memória (aproximado) do cache de resultados compartilhado pelas sessões
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+_lock = threading.Lock()
+_entradas = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+
+
+def estimate_size(valor) -> int:
+    """Estima, em bytes, a memória ocupada por um resultado (DataFrames, arrays e coleções deles)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, np.ndarray):
+        return int(valor.nbytes)
+    if isinstance(valor, (list, tuple, set)):
+        return sys.getsizeof(valor) + sum(estimate_size(v) for v in valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(estimate_size(k) + estimate_size(v) for k, v in valor.items())
+    return sys.getsizeof(valor)
+
+
+def _evict(max_bytes: int):
+    """Remove as entradas menos usadas recentemente até caber no limite. Chamar com o lock."""
+    while _entradas and _stats["bytes"] > max_bytes:
+        _, (_, tamanho) = _entradas.popitem(last=False)
+        _stats["bytes"] -= tamanho
+        _stats["evictions"] += 1
+
+
+def get_or_compute(geracao: int, chave, calcular, max_bytes: int = None):
+    """
+    Retorna o resultado de calcular() guardado para (geracao, chave), calculando-o apenas
+    na primeira vez. O cache é do processo, portanto compartilhado por todas as sessões;
+    cada carga bem-sucedida incrementa a geração dos dados (ver database.bump_data_generation),
+    o que torna obsoletas as entradas antigas. A remoção é por tamanho (LRU).
+    Os resultados são compartilhados: quem usa não deve alterá-los no lugar.
+    """
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    id_entrada = (geracao, chave)
+
+    with _lock:
+        if id_entrada in _entradas:
+            _entradas.move_to_end(id_entrada)
+            _stats["hits"] += 1
+            return _entradas[id_entrada][0]
+        _stats["misses"] += 1
+
+    valor = calcular()
+    tamanho = estimate_size(valor)
+
+    with _lock:
+        # Entradas de gerações anteriores nunca mais serão lidas
+        for antiga in [k for k in _entradas if k[0] < geracao]:
+            _stats["bytes"] -= _entradas.pop(antiga)[1]
+            _stats["evictions"] += 1
+        if id_entrada not in _entradas and tamanho <= max_bytes:
+            _entradas[id_entrada] = (valor, tamanho)
+            _stats["bytes"] += tamanho
+            _evict(max_bytes)
+    return valor
+
+
+def cache_stats() -> dict:
+    """Retorna os contadores do cache: acertos, faltas, remoções, entradas e bytes ocupados."""
+    with _lock:
+        return {**_stats, "entries": len(_entradas)}
+
+
+def clear_cache():
+    """Esvazia o cache e zera os contadores."""
+    with _lock:
+        _entradas.clear()
+        _stats.update(hits=0, misses=0, evictions=0, bytes=0)
@@ -1,41 +1,153 @@
 import pandas as pd
+import numpy as np
 from io import BytesIO
 import re
 import datetime
 
 def to_excel(df: pd.DataFrame, sheet_name: str) -> bytes:
     """Converte um DataFrame para um arquivo Excel em memória."""
+    return to_excel_conditional(df, sheet_name, [])
+
+CRITICIDADE_BINS = np.array([25, 55, 100])
+
+# Níveis de severidade: -1 = sem valor, 0 = Exceção, 1 = Suficiente ... 4 = SuperCrítico.
+# As tabelas abaixo são indexadas por (nível + 1).
+CRITICIDADE_ROTULOS = np.array(
+    [None, "Exceção", "Suficiente", "Aceitável", "Crítico", "SuperCrítico"], dtype=object
+)
+CRITICIDADE_ESTILOS = np.array([
+    "",
+    "background-color: gray; color: black;",
+    "background-color: #66cc66; color: black;",
+    "background-color: #FCDA51; color: black;",
+    "background-color: #ffa500; color: black;",
+    "background-color: #ff4d4d; color: black;",
+], dtype=object)
+
+# Categorias de item que sobrepõem a cor de criticidade na tabela consolidada
+# (0 = sem categoria, usa a criticidade). A ordem de precedência é a inversa dos códigos.
+CATEGORIA_NENHUMA, CATEGORIA_EXCECAO, CATEGORIA_SERVICO, CATEGORIA_ESPECIAL = 0, 1, 2, 3
+CATEGORIA_ESTILOS = np.array([
+    "",
+    "background-color: gray; color: black;",
+    "background-color: #3C5096; color: white;",
+    "background-color: #B845F5; color: white",
+], dtype=object)
+
+# Prioridade pela ponderação (%): acima de cada limite, o rótulo correspondente; senão "Prioridade 3"
+PRIORIDADE_LIMITES = [(1.0, "Prioridade 1"), (0.4, "Prioridade 2")]
+PRIORIDADE_PADRAO = "Prioridade 3"
+
+# Quantidade mínima de cotações para um item ser considerado coberto
+COBERTURA_MINIMA = 100
+
+def to_numeric_array(values) -> np.ndarray:
+    """Converte um vetor, Series, DataFrame ou matriz em array float; valores não numéricos viram NaN."""
+    if isinstance(values, pd.DataFrame):
+        return values.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    arr = np.asarray(values)
+    if arr.dtype.kind in "biuf":
+        return arr.astype(float)
+    flat = pd.to_numeric(pd.Series(arr.ravel(), dtype=object), errors="coerce")
+    return flat.to_numpy(dtype=float).reshape(arr.shape)
+
+def classify_criticidade(values) -> tuple:
+    """
+    Classifica de uma só vez um vetor ou matriz de quantidades de cotações.
+    Retorna (niveis, rotulos) com o mesmo formato da entrada: niveis em int8
+    (4 = SuperCrítico, 3 = Crítico, 2 = Aceitável, 1 = Suficiente, -1 = sem valor)
+    e rotulos com o nome da criticidade (None quando não há valor).
+    """
+    arr = to_numeric_array(values)
+    niveis = (4 - np.searchsorted(CRITICIDADE_BINS, arr, side="left")).astype(np.int8)
+    niveis[np.isnan(arr)] = -1
+    return niveis, criticidade_labels(niveis)
+
+def criticidade_labels(niveis) -> np.ndarray:
+    """Converte níveis de severidade (incluindo 0 = Exceção) nos rótulos de criticidade."""
+    return CRITICIDADE_ROTULOS[np.asarray(niveis) + 1]
+
+def criticidade_styles(niveis) -> np.ndarray:
+    """Converte níveis de severidade (incluindo 0 = Exceção) nos estilos CSS das células."""
+    return CRITICIDADE_ESTILOS[np.asarray(niveis) + 1]
+
+def css_to_excel_format(css: str) -> dict:
+    """Converte um estilo CSS simples (background-color/color) nas opções de formato do xlsxwriter."""
+    propriedades = dict(
+        parte.split(":", 1) for parte in css.split(";") if ":" in parte
+    )
+    propriedades = {k.strip(): v.strip() for k, v in propriedades.items()}
+    formato = {}
+    if "background-color" in propriedades:
+        formato["bg_color"] = propriedades["background-color"]
+    if "color" in propriedades:
+        formato["font_color"] = propriedades["color"]
+    return formato
+
+def excel_column_letter(idx: int) -> str:
+    """Letra da coluna do Excel para um índice começando em 0 (0 -> A, 26 -> AA)."""
+    letras = ""
+    idx += 1
+    while idx:
+        idx, resto = divmod(idx - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+def _criticidade_rules(category_cell=None) -> list:
+    """Regras (critério com {c} para a célula, CSS) na ordem de precedência da tela."""
+    regras = []
+    if category_cell is not None:
+        for codigo in (CATEGORIA_ESPECIAL, CATEGORIA_SERVICO, CATEGORIA_EXCECAO):
+            regras.append((f"{category_cell}={codigo}", CATEGORIA_ESTILOS[codigo]))
+    for i, limite in enumerate(int(b) for b in CRITICIDADE_BINS):
+        regras.append((f"AND(ISNUMBER({{c}}),{{c}}<={limite})", CRITICIDADE_ESTILOS[5 - i]))
+    regras.append(("ISNUMBER({c})", CRITICIDADE_ESTILOS[2]))
+    return regras
+
+def to_excel_conditional(df: pd.DataFrame, sheet_name: str, value_columns, category_column=None) -> bytes:
+    """
+    Exporta o DataFrame para Excel com as cores de criticidade das colunas value_columns
+    como regras de formatação condicional (uma regra por faixa, não um formato por célula).
+    Se category_column for informada (códigos CATEGORIA_*), a coluna é gravada oculta e as
+    categorias têm precedência sobre a criticidade, como na tela.
+    As linhas são gravadas em ordem no modo constant_memory do xlsxwriter, que mantém em
+    memória só a linha corrente.
+    """
+    import xlsxwriter
+
     output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name=sheet_name)
-    return output.getvalue()
+    workbook = xlsxwriter.Workbook(output, {
+        "constant_memory": True,
+        "default_date_format": "dd/mm/yyyy",
+        "nan_inf_to_errors": True,
+    })
+    worksheet = workbook.add_worksheet(sheet_name)
 
-def highlight_values(cell_value):
-    """Retorna o estilo de formatação de célula com base no valor."""
-    try:
-        valor = float(cell_value)
-        if valor <= 25:
-            return "background-color: #ff4d4d; color: black" 
-        elif valor <= 55:
-            return "background-color: #ffa500; color: black" 
-        elif valor <= 100:
-            return "background-color: #FCDA51; color: black"  
-        else:
-            return "background-color: #66cc66; color: black" 
-    except:
-        return ""
-
-def get_criticidade(valor):
-    """Retorna a criticidade de um valor numérico."""
-    try:
-        valor = float(valor)
-        if valor <= 25:
-            return "SuperCrítico"
-        elif valor <= 55:
-            return "Crítico"
-        elif valor <= 100:
-            return "Aceitável"
-        else:
-            return "Suficiente"
-    except:
-        return None
+    header = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    worksheet.write_row(0, 0, [str(c) for c in df.columns], header)
+    valores = df.astype(object).where(df.notna(), None)
+    for i, linha in enumerate(valores.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(i, 0, linha)
+
+    category_cell = None
+    if category_column is not None:
+        idx_cat = df.columns.get_loc(category_column)
+        worksheet.set_column(idx_cat, idx_cat, None, None, {"hidden": True})
+        category_cell = f"${excel_column_letter(idx_cat)}2"
+
+    formatos = {}
+    for col in value_columns if len(df) else []:
+        idx = df.columns.get_loc(col)
+        celula = f"{excel_column_letter(idx)}2"
+        for criterio, css in _criticidade_rules(category_cell):
+            if css not in formatos:
+                formatos[css] = workbook.add_format(css_to_excel_format(css))
+            worksheet.conditional_format(1, idx, len(df), idx, {
+                "type": "formula",
+                "criteria": "=" + criterio.replace("{c}", celula),
+                "format": formatos[css],
+                "stop_if_true": True,
+            })
+
+    workbook.close()
+    return output.getvalue()
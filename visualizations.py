@@ -1,36 +1,120 @@
+from io import BytesIO
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import streamlit as st
 
-def plot_bar_chart(df_bar_series: pd.DataFrame, last_date) -> None:
-    """Cria um gráfico de barras para o último mês."""
-    fig, ax = plt.subplots(figsize=(8, 6))
+from result_cache import get_or_compute
+
+# Acima destes limites o gráfico de série usa o caminho rápido (ver reduce_time_series)
+MAX_SERIES_DETALHADAS = 20
+MAX_DATAS_GRAFICO = 120
+
+# Largura máxima (px) que o Streamlit exibe sem reduzir a imagem (2 x 730, para telas de alta densidade)
+LARGURA_MAXIMA_IMAGEM = 1460
+
+def figure_png(fig: Figure) -> bytes:
+    """
+    Renderiza a figura em PNG com os mesmos padrões do st.pyplot (bbox justo, 200 dpi).
+    A imagem já sai reduzida à largura que o Streamlit exibe, para que st.image não tenha
+    de decodificar e recodificar o PNG a cada exibição.
+    """
+    from PIL import Image
+
+    output = BytesIO()
+    fig.savefig(output, format="png", dpi=200, bbox_inches="tight")
+    imagem = Image.open(output)
+    largura, altura = imagem.size
+    if largura <= LARGURA_MAXIMA_IMAGEM:
+        return output.getvalue()
+
+    reduzida = BytesIO()
+    imagem.resize(
+        (LARGURA_MAXIMA_IMAGEM, int(altura * LARGURA_MAXIMA_IMAGEM / largura)), resample=Image.BILINEAR
+    ).save(reduzida, format="PNG")
+    return reduzida.getvalue()
+
+def reduce_time_series(df_pivot: pd.DataFrame) -> pd.DataFrame:
+    """
+    Com mais de MAX_DATAS_GRAFICO datas, agrega as datas em blocos consecutivos (média de
+    cada bloco, datada pelo início dele) para desenhar no máximo esse número de pontos.
+    """
+    n = len(df_pivot.index)
+    if n <= MAX_DATAS_GRAFICO:
+        return df_pivot
+    passo = int(np.ceil(n / MAX_DATAS_GRAFICO))
+    blocos = np.arange(n) // passo
+    reduzido = df_pivot.groupby(blocos).mean()
+    reduzido.index = df_pivot.index[::passo]
+    return reduzido
+
+def render_bar_chart(df_bar_series: pd.DataFrame, last_date) -> bytes:
+    """Gráfico de barras do último mês, em PNG."""
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
     df_bar_series.plot(kind="bar", ax=ax)
     ax.set_xlabel("UF")
     ax.set_ylabel("Quantidade de cotações")
     ax.set_title(f"Última Data: {last_date.strftime('%m/%Y')}")
-    st.pyplot(fig)
+    return figure_png(fig)
+
+def render_time_series(df_pivot: pd.DataFrame) -> bytes:
+    """
+    Gráfico de série histórica com as faixas de criticidade, em PNG.
+    Com mais de MAX_SERIES_DETALHADAS séries, as linhas são desenhadas numa única chamada,
+    sem marcadores, e a legenda vai para fora do gráfico em fonte menor.
+    """
+    df_plot = reduce_time_series(df_pivot)
+    muitas_series = df_plot.shape[1] > MAX_SERIES_DETALHADAS
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
 
-def plot_time_series(df_pivot: pd.DataFrame) -> None:
-    """Cria um gráfico de série histórica para os itens selecionados com regiões demarcadas."""
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
     # Plota as séries históricas
-    for col in df_pivot.columns:
-        ax.plot(df_pivot.index, df_pivot[col], marker="o", label=f"{col[0]} - {col[1]}")
-    
+    rotulos = [f"{col[0]} - {col[1]}" for col in df_plot.columns]
+    if muitas_series:
+        ax.plot(df_plot.index, df_plot.to_numpy(dtype=float), linewidth=1, label=rotulos)
+    else:
+        for col, rotulo in zip(df_plot.columns, rotulos):
+            ax.plot(df_plot.index, df_plot[col], marker="o", label=rotulo)
+
     ax.set_xlabel("Data")
     ax.set_ylabel("Quantidade de Cotações")
     ax.set_title("Série Histórica")
-    
-    max_val = df_pivot.max().max() * 1.1 
-    
+
+    max_val = df_plot.max().max() * 1.1
+
     ax.axhspan(0, 25, facecolor='#ff4d4d', alpha=0.3, label="Super Crítico (<=25)")
     ax.axhspan(25, 55, facecolor='#ffa500', alpha=0.3, label="Crítico (26-55)")
     ax.axhspan(55, 100, facecolor='#FCDA51', alpha=0.3, label="Aceitável (56-100)")
     ax.axhspan(100, max_val, facecolor='#66cc66', alpha=0.3, label="Suficiente (>100)")
-    
-    ax.set_ylim(0, max_val)  
-    
-    ax.legend(title="Região - Produto", loc="best")
-    st.pyplot(fig)
+
+    ax.set_ylim(0, max_val)
+
+    if muitas_series:
+        ax.legend(title="Região - Produto", loc="upper left", bbox_to_anchor=(1.01, 1),
+                  fontsize="x-small", ncol=2)
+    else:
+        ax.legend(title="Região - Produto", loc="best")
+    return figure_png(fig)
+
+def _show_png(tipo: str, db_path, geracao, chave, render) -> None:
+    """
+    Exibe o PNG gerado por render(). Com db_path, geracao e chave (a seleção exibida), a imagem
+    fica no cache de resultados por (banco, geração, tipo de gráfico, seleção), com remoção LRU
+    por tamanho.
+    """
+    if db_path is None or geracao is None or chave is None:
+        png = render()
+    else:
+        png = get_or_compute(geracao, (db_path, "figura", tipo, chave), render)
+    st.image(png, width="stretch")
+
+def plot_bar_chart(df_bar_series: pd.DataFrame, last_date, db_path=None, geracao=None, chave=None) -> None:
+    """Cria um gráfico de barras para o último mês."""
+    _show_png("barras", db_path, geracao, chave, lambda: render_bar_chart(df_bar_series, last_date))
+
+def plot_time_series(df_pivot: pd.DataFrame, db_path=None, geracao=None, chave=None) -> None:
+    """Cria um gráfico de série histórica para os itens selecionados com regiões demarcadas."""
+    _show_png("serie", db_path, geracao, chave, lambda: render_time_series(df_pivot))